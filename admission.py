@@ -0,0 +1,149 @@
+import asyncio
+import math
+import os
+import time
+from collections import defaultdict
+from contextlib import asynccontextmanager
+from dotenv import load_dotenv
+from fastapi import HTTPException
+import metrics
+from deadline import NO_DEADLINE, DeadlineExceeded
+
+load_dotenv()
+
+ADMISSION_MAX_CONCURRENCY = int(os.getenv("ADMISSION_MAX_CONCURRENCY", 4))
+ADMISSION_MAX_QUEUE_DEPTH = int(os.getenv("ADMISSION_MAX_QUEUE_DEPTH", 64))
+ADMISSION_DEADLINE_MS = float(os.getenv("ADMISSION_DEADLINE_MS", 30000))
+ADMISSION_PER_KEY_CONCURRENCY = int(os.getenv("ADMISSION_PER_KEY_CONCURRENCY", 8))
+# Inference slots one key may hold at once; kept below ADMISSION_MAX_CONCURRENCY so
+# that other keys always find a free slot.
+ADMISSION_PER_KEY_ACTIVE = int(os.getenv("ADMISSION_PER_KEY_ACTIVE", max(1, ADMISSION_MAX_CONCURRENCY // 2)))
+SERVICE_TIME_SMOOTHING = 0.1
+
+admission_rejections = metrics.REGISTRY.register(metrics.Counter(
+    "guardrails_admission_rejections_total", "Requests shed before inference.", ["reason"]
+))
+admission_wait_time = metrics.REGISTRY.register(metrics.Histogram(
+    "guardrails_admission_wait_seconds", "Time requests waited for an inference slot."
+))
+
+
+class AdmissionController:
+    """Bounded per-worker queue in front of the inference stage.
+    At most max_concurrency requests run inference at once and at most max_queue_depth
+    wait for a slot. A request is shed as soon as its estimated wait exceeds its
+    deadline, and no API key may hold more than per_key_concurrency slots or places.
+    A key's requests first wait for one of its per_key_active slots, so one key can
+    never occupy every inference slot while other keys queue behind it.
+    A request whose own deadline passes, or which is cancelled, while it waits is not
+    shed: admit() raises DeadlineExceeded so the caller can report it as timed out."""
+
+    def __init__(self, max_concurrency, max_queue_depth, per_key_concurrency, deadline, per_key_active=None):
+        self.max_concurrency = max_concurrency
+        self.max_queue_depth = max_queue_depth
+        self.per_key_concurrency = per_key_concurrency
+        self.per_key_active = min(per_key_active or max_concurrency, max_concurrency)
+        self.deadline = deadline
+        self.service_time = 0.0
+        self.waiting = 0
+        self.active = 0
+        self.per_key = defaultdict(int)
+        self._key_slots = {}
+        self._slots = asyncio.Semaphore(max_concurrency)
+
+    def estimated_wait(self):
+        if self.active < self.max_concurrency:
+            return 0.0
+        return (self.waiting + 1) * self.service_time / self.max_concurrency
+
+    def _reject(self, status_code, reason, retry_after, detail):
+        admission_rejections.inc(reason=reason)
+        raise HTTPException(
+            status_code=status_code,
+            detail=detail,
+            headers={"Retry-After": str(max(1, math.ceil(retry_after)))},
+        )
+
+    def check(self, api_key, deadline=None):
+        """Raises 429/503 if the request would be shed; cheap enough to call before any work."""
+        deadline = self.deadline if deadline is None else deadline
+        if self.per_key.get(api_key, 0) >= self.per_key_concurrency:
+            self._reject(429, "per_key_limit", self.service_time, "Too many concurrent requests for this API key")
+        if self.waiting >= self.max_queue_depth:
+            self._reject(503, "queue_full", self.estimated_wait(), "Server is overloaded, retry later")
+        estimated_wait = self.estimated_wait()
+        if estimated_wait > deadline:
+            self._reject(503, "deadline", estimated_wait, "Server is overloaded, retry later")
+
+    async def _acquire(self, key_slots):
+        await key_slots.acquire()
+        try:
+            await self._slots.acquire()
+        except BaseException:
+            key_slots.release()
+            raise
+
+    @asynccontextmanager
+    async def admit(self, api_key, deadline=NO_DEADLINE):
+        if deadline.expired():
+            raise DeadlineExceeded()
+        remaining = deadline.remaining()
+        self.check(api_key, remaining)
+        self.per_key[api_key] += 1
+        key_slots = self._key_slots.get(api_key)
+        if key_slots is None:
+            key_slots = self._key_slots[api_key] = asyncio.Semaphore(self.per_key_active)
+        try:
+            self.waiting += 1
+            queued_at = time.perf_counter()
+            try:
+                # The request's deadline, or a disconnect, ends the wait with DeadlineExceeded;
+                # requests without one are shed after the controller's deadline.
+                await asyncio.wait_for(
+                    deadline.run(self._acquire(key_slots)),
+                    timeout=self.deadline if remaining is None else None,
+                )
+            except asyncio.TimeoutError:
+                self._reject(503, "deadline", self.estimated_wait(), "Server is overloaded, retry later")
+            finally:
+                self.waiting -= 1
+            admission_wait_time.observe(time.perf_counter() - queued_at)
+
+            self.active += 1
+            started_at = time.perf_counter()
+            try:
+                yield
+            finally:
+                self.active -= 1
+                self._slots.release()
+                key_slots.release()
+                elapsed = time.perf_counter() - started_at
+                self.service_time = elapsed if not self.service_time else \
+                    self.service_time + SERVICE_TIME_SMOOTHING * (elapsed - self.service_time)
+        finally:
+            self.per_key[api_key] -= 1
+            if not self.per_key[api_key]:
+                del self.per_key[api_key]
+                del self._key_slots[api_key]
+
+    def collect_metrics(self):
+        collected = []
+        for name, documentation, value in [
+            ("guardrails_admission_queue_depth", "Requests waiting for an inference slot.", self.waiting),
+            ("guardrails_admission_active", "Requests currently running inference.", self.active),
+            ("guardrails_admission_service_seconds", "Smoothed inference time per request.", self.service_time),
+        ]:
+            gauge = metrics.Gauge(name, documentation)
+            gauge.set(value)
+            collected.append(gauge)
+        return collected
+
+
+admission = AdmissionController(
+    ADMISSION_MAX_CONCURRENCY,
+    ADMISSION_MAX_QUEUE_DEPTH,
+    ADMISSION_PER_KEY_CONCURRENCY,
+    ADMISSION_DEADLINE_MS / 1000,
+    ADMISSION_PER_KEY_ACTIVE,
+)
+metrics.REGISTRY.add_collector(admission.collect_metrics)
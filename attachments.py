@@ -0,0 +1,357 @@
+import asyncio
+import csv
+import ipaddress
+import logging
+import os
+import socket
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from itertools import islice
+from urllib.parse import urlsplit
+import requests
+from dotenv import load_dotenv
+from fastapi.concurrency import run_in_threadpool
+import metrics
+from config import list_validators, merge_validation_outputs, resolve_validators
+from database import Api, AttachmentJob, Event, SessionLocal
+from executor import run_list_validators, run_validators
+from stats import combine_statuses, record_validation_stats
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+ATTACHMENT_WORKERS = int(os.getenv("ATTACHMENT_WORKERS", 2))
+ATTACHMENT_QUEUE_SIZE = int(os.getenv("ATTACHMENT_QUEUE_SIZE", 100))
+ATTACHMENT_CHUNK_CHARS = int(os.getenv("ATTACHMENT_CHUNK_CHARS", 2000))
+# Chunks of one attachment validated together: list validators such as DetectJailbreak
+# score them in one call, the other validators run on them concurrently.
+ATTACHMENT_CHUNK_CONCURRENCY = int(os.getenv("ATTACHMENT_CHUNK_CONCURRENCY", 8))
+# Threads shared by all attachment jobs, apart from the default executor that serves
+# /validate, so that background work can't starve interactive requests of threads.
+ATTACHMENT_VALIDATOR_THREADS = int(os.getenv("ATTACHMENT_VALIDATOR_THREADS", 2))
+ATTACHMENT_WRITE_CHUNK_BYTES = 1024 * 1024
+CALLBACK_TIMEOUT = 10
+# When set, callbacks may only go to these hosts, which may then be internal.
+ATTACHMENT_CALLBACK_ALLOWED_HOSTS = set(filter(None, os.getenv("ATTACHMENT_CALLBACK_ALLOWED_HOSTS", "").lower().split(",")))
+
+IMAGE_EXTENSIONS = {".png", ".jpg", ".jpeg", ".gif", ".bmp", ".tiff", ".webp"}
+
+
+class UnsupportedAttachment(Exception):
+    pass
+
+
+def write_upload(source, path):
+    """Copies an upload to path a block at a time and returns its size."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    size = 0
+    with open(path, "wb") as f:
+        while block := source.read(ATTACHMENT_WRITE_CHUNK_BYTES):
+            f.write(block)
+            size += len(block)
+    return size
+
+
+def remove_upload(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def _pdf_text(path):
+    from pypdf import PdfReader
+
+    for page in PdfReader(path).pages:
+        yield page.extract_text() or ""
+
+
+def _docx_text(path):
+    import docx
+
+    # python-docx has no streaming reader, so the whole document is parsed up front.
+
+    for paragraph in docx.Document(path).paragraphs:
+        yield paragraph.text
+
+
+def _xlsx_text(path):
+    from openpyxl import load_workbook
+
+    # read_only streams rows instead of building the whole sheet.
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        for sheet in workbook.worksheets:
+            for row in sheet.iter_rows(values_only=True):
+                yield "\t".join(str(cell) for cell in row if cell is not None)
+    finally:
+        workbook.close()
+
+
+def _csv_text(path):
+    with open(path, newline="", errors="replace") as f:
+        for row in csv.reader(f, delimiter="\t" if path.endswith(".tsv") else ","):
+            yield "\t".join(row)
+
+
+def _plain_text(path):
+    with open(path, errors="replace") as f:
+        yield from f
+
+
+EXTRACTORS = {
+    ".pdf": _pdf_text,
+    ".docx": _docx_text,
+    ".xlsx": _xlsx_text,
+    ".xlsm": _xlsx_text,
+    ".csv": _csv_text,
+    ".tsv": _csv_text,
+}
+
+
+def extract_chunks(path, file_type, chunk_chars=ATTACHMENT_CHUNK_CHARS):
+    """Yields the attachment's text in chunks of at most chunk_chars, reading it
+    incrementally so that large files never sit in memory whole. The exception is
+    docx, which is parsed in full before its first chunk."""
+    extension = os.path.splitext(path)[1].lower()
+    if file_type == "image" or extension in IMAGE_EXTENSIONS:
+        raise UnsupportedAttachment("Text can't be extracted from images")
+
+    chunk = ""
+    for piece in EXTRACTORS.get(extension, _plain_text)(path):
+        piece = piece.strip()
+        if not piece:
+            continue
+        chunk = f"{chunk}\n{piece}" if chunk else piece
+        while len(chunk) >= chunk_chars:
+            yield chunk[:chunk_chars]
+            chunk = chunk[chunk_chars:]
+    if chunk:
+        yield chunk
+
+
+def job_payload(job):
+    return {
+        "job_id": job.job_id,
+        "event_id": job.event_id,
+        "status": job.status,
+        "attachment_file_path": job.file_path,
+        "attachment_file_type": job.file_type,
+        "result": job.result,
+        "error": job.error,
+        "created_at": job.created_at.isoformat() if job.created_at else None,
+        "finished_at": job.finished_at.isoformat() if job.finished_at else None,
+    }
+
+
+def check_callback_url(url):
+    """Raises ValueError unless the callback may be sent to url. Without an allowlist the
+    host must resolve to public addresses only, so that callers can't point the service
+    at loopback, the private network or cloud metadata endpoints."""
+    parts = urlsplit(url)
+    host = (parts.hostname or "").lower()
+    if parts.scheme not in ("http", "https") or not host:
+        raise ValueError("attachment_callback_url must be an http(s) URL")
+    if ATTACHMENT_CALLBACK_ALLOWED_HOSTS:
+        if host not in ATTACHMENT_CALLBACK_ALLOWED_HOSTS:
+            raise ValueError("attachment_callback_url host is not allowed")
+        return
+
+    try:
+        infos = socket.getaddrinfo(host, parts.port or (443 if parts.scheme == "https" else 80), type=socket.SOCK_STREAM)
+    except socket.gaierror:
+        raise ValueError("attachment_callback_url host can't be resolved")
+    for info in infos:
+        address = ipaddress.ip_address(info[4][0].split("%")[0])
+        if not address.is_global or address.is_multicast:
+            raise ValueError("attachment_callback_url must resolve to a public address")
+
+
+def _post_callback(url, payload):
+    try:
+        # Checked again here, since the host may resolve differently by the time the job finishes.
+        check_callback_url(url)
+        # Redirects are not followed: they could lead to an address the check would reject.
+        requests.post(url, json=payload, timeout=CALLBACK_TIMEOUT, allow_redirects=False).raise_for_status()
+    except (ValueError, requests.RequestException) as e:
+        logger.warning("Attachment callback failed", extra={"callback_url": url, "error": repr(e)})
+
+
+class AttachmentPipeline:
+    """Validates uploaded attachments in the background. Jobs wait in a bounded queue
+    and a fixed number of workers extract each file's text chunk by chunk and run the
+    chunks through the key's input validators on a thread pool of their own. Jobs still
+    queued or running when the app process exits are left in that state."""
+
+    def __init__(self, workers, queue_size, validator_threads=ATTACHMENT_VALIDATOR_THREADS):
+        self.workers = workers
+        self.queue_size = queue_size
+        self.validator_threads = validator_threads
+        self.thread_pool = None
+        self.queue = None
+        self.running = 0
+        # Slots claimed by requests still writing their upload, see reserve().
+        self.reserved = 0
+        self._tasks = []
+
+    async def start(self):
+        self.queue = asyncio.Queue(maxsize=self.queue_size)
+        self.thread_pool = ThreadPoolExecutor(self.validator_threads, thread_name_prefix="attachment-validator")
+        self._tasks = [asyncio.create_task(self._work()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        if self.thread_pool is not None:
+            self.thread_pool.shutdown(wait=False, cancel_futures=True)
+            self.thread_pool = None
+
+    def reserve(self):
+        """Claims a queue slot for a job about to be submitted, or returns False when
+        the queue is full. Checking and claiming happen without yielding to the loop,
+        so concurrent requests can't both take the last slot. Call release() once the
+        job has been submitted or abandoned."""
+        if self.queue is None or self.queue.qsize() + self.reserved >= self.queue_size:
+            return False
+        self.reserved += 1
+        return True
+
+    def release(self):
+        self.reserved -= 1
+
+    def submit(self, db, api_id, event, file_path, file_type, callback_url=None):
+        """Records and queues a job in the slot taken by reserve()."""
+        job = AttachmentJob(
+            job_id=str(uuid.uuid4()),
+            api_id=api_id,
+            event_id=event.event_id,
+            event_row_id=event.id,
+            file_path=file_path,
+            file_type=file_type,
+            callback_url=callback_url,
+            status="queued",
+        )
+        job_id = job.job_id
+        db.add(job)
+        db.commit()
+        self.queue.put_nowait(job_id)
+        return job_id
+
+    async def _work(self):
+        while True:
+            job_id = await self.queue.get()
+            self.running += 1
+            try:
+                await self.process(job_id)
+            except Exception:
+                logger.exception("Attachment job failed", extra={"job_id": job_id})
+            finally:
+                self.running -= 1
+                self.queue.task_done()
+
+    async def process(self, job_id):
+        db = SessionLocal()
+        try:
+            job = db.query(AttachmentJob).filter(AttachmentJob.job_id == job_id).first()
+            if job is None:
+                logger.warning("Attachment job disappeared before it ran", extra={"job_id": job_id})
+                return
+            api = db.query(Api).filter(Api.id == job.api_id).first()
+            job.status = "running"
+            db.commit()
+            try:
+                if api is None:
+                    raise LookupError("The API key was deleted")
+                result = await self._validate_file(db, job, api)
+            except UnsupportedAttachment as e:
+                job.status, job.error = "unsupported", str(e)
+            except Exception as e:
+                job.status, job.error = "failed", str(e)
+            else:
+                job.status, job.result = "done", result
+                # Locked, since /validate may be writing its own entry to the same row.
+                event = db.query(Event).filter(Event.id == job.event_row_id).with_for_update().first()
+                if event:
+                    event.results = [*(event.results or []), {
+                        "type": "attachment",
+                        "attachment_job_id": job.job_id,
+                        "attachment_file_path": job.file_path,
+                        "attachment_file_type": job.file_type,
+                        "validation_outcome": {
+                            "validation_passed": result["validation_passed"],
+                            "chunks": result["chunks"],
+                            "failed_chunks": [chunk["chunk"] for chunk in result["failed_chunks"]],
+                        },
+                    }]
+            job.finished_at = datetime.now(timezone.utc)
+            db.commit()
+            callback_url, payload = job.callback_url, job_payload(job)
+        finally:
+            db.close()
+        if callback_url:
+            await run_in_threadpool(_post_callback, callback_url, payload)
+
+    async def _validate_file(self, db, job, api):
+        validator_names = resolve_validators("input", api.input_validators.split(","))
+        chunks = extract_chunks(job.file_path, job.file_type)
+        outcomes = []
+        while True:
+            # Extraction blocks on file I/O and parsing, so each batch is pulled off the loop.
+            batch = await run_in_threadpool(list, islice(chunks, ATTACHMENT_CHUNK_CONCURRENCY))
+            if not batch:
+                break
+            outcomes.extend(await self._validate_batch(batch, validator_names, api.validation_policy))
+
+        # The attachment counts as one validation in the rollup, however many chunks it had.
+        record_validation_stats(db, job.api_id, combine_statuses(statuses for _, statuses in outcomes))
+        failed_chunks = [
+            {
+                "chunk": index,
+                "validation_outcome": {key: value for key, value in outcome.items() if key != "raw_llm_output"},
+            }
+            for index, (outcome, _) in enumerate(outcomes)
+            if not outcome["validation_passed"]
+        ]
+        return {
+            "validation_passed": not failed_chunks,
+            "chunks": len(outcomes),
+            "chunk_chars": ATTACHMENT_CHUNK_CHARS,
+            "failed_chunks": failed_chunks,
+        }
+
+    async def _validate_batch(self, batch, validator_names, policy):
+        """Returns (outcome, {validator name: (status, seconds)}) per chunk of batch."""
+        listed = [name for name in validator_names if name in list_validators]
+        others = [name for name in validator_names if name not in list_validators]
+        list_runs = await run_list_validators(listed, batch, self.thread_pool) if listed else [{} for _ in batch]
+        results = await asyncio.gather(*(
+            run_validators("input", others, chunk, policy=policy, thread_pool=self.thread_pool) for chunk in batch
+        ))
+        validated = []
+        for chunk, runs, (outcome, statuses) in zip(batch, list_runs, results):
+            outcome = merge_validation_outputs(chunk, [outcome, *(run_outcome for run_outcome, _ in runs.values())])
+            statuses.update(
+                (name, ("pass" if run_outcome["validation_passed"] else "fail", seconds))
+                for name, (run_outcome, seconds) in runs.items()
+            )
+            validated.append((outcome, statuses))
+        return validated
+
+    def collect_metrics(self):
+        collected = []
+        for name, documentation, value in [
+            ("guardrails_attachment_queue_depth", "Attachments waiting for validation.", self.queue.qsize() if self.queue else 0),
+            ("guardrails_attachment_running", "Attachments being validated.", self.running),
+        ]:
+            gauge = metrics.Gauge(name, documentation)
+            gauge.set(value)
+            collected.append(gauge)
+        return collected
+
+
+attachment_pipeline = AttachmentPipeline(ATTACHMENT_WORKERS, ATTACHMENT_QUEUE_SIZE)
+metrics.REGISTRY.add_collector(attachment_pipeline.collect_metrics)
@@ -2,6 +2,7 @@ from fastapi import Depends, HTTPException
 from sqlalchemy.orm import Session
 from fastapi.security.api_key import APIKeyHeader
 from database import get_db, Api, Event as UserSession
+from tracing import span
 
 API_KEY_HEADER = APIKeyHeader(name="X-API-Key", auto_error=False)
 
@@ -9,13 +10,16 @@ async def get_validators(api_key: str = Depends(API_KEY_HEADER), db: Session = D
     if not api_key:
         raise HTTPException(status_code=401, detail="API key missing")
 
-    api = db.query(Api).filter(Api.api_key == api_key).first()
+    with span("get_validators"):
+        api = db.query(Api).filter(Api.api_key == api_key).first()
     if not api:
         raise HTTPException(status_code=401, detail="Invalid API key")
 
     return {
+        "api_id": api.id,
         "input_validators": api.input_validators.split(","),
         "output_validators": api.output_validators.split(","),
+        "validation_policy": api.validation_policy,
     }
 
 async def verify_key(api_key: str = Depends(API_KEY_HEADER), db: Session = Depends(get_db)):
@@ -28,9 +32,9 @@ async def verify_key(api_key: str = Depends(API_KEY_HEADER), db: Session = Depen
 
     return api_key
 
-async def verify_session(event_id: str, api_key: str, db: Session):
+async def verify_session(event_id: str, api_id: int, db: Session):
+    """Returns the session's first event if it belongs to the key with api_id."""
     session = db.query(UserSession).filter(UserSession.event_id == event_id).first()
-    api = db.query(Api).filter(Api.api_key == api_key).first()
-    if not api or not session or session.api_id != api.id:
+    if not session or session.api_id != api_id:
         return None
-    return event_id
\ No newline at end of file
+    return session
\ No newline at end of file
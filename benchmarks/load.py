@@ -0,0 +1,225 @@
+"""Load and latency benchmark for /start_event and /validate against the real FastAPI app.
+
+Runs fully offline: SQLite (or --database-url) stands in for Postgres, fakeredis backs
+the rate limiter and a locally served JWKS with a throwaway RSA key stands in for
+Auth0. With --mode stub every hub validator is replaced by a fixed-latency stub.
+
+    python benchmarks/load.py --mode stub --requests 500 --concurrency 32
+    python benchmarks/load.py --mode real --scenarios single,concurrent --output bench.json
+"""
+import argparse
+import asyncio
+import base64
+import json
+import math
+import os
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from jose import jwt
+
+AUTH0_DOMAIN = "bench.local"
+AUTH0_AUDIENCE = "guardrails-bench"
+SCENARIOS = ["single", "concurrent", "mixed", "attachments"]
+PROMPT = "Summarize the attached quarterly report and list the three largest cost centers."
+SYSTEM_PROMPT = "You are a helpful assistant for the finance team."
+
+
+def _b64(number):
+    raw = number.to_bytes((number.bit_length() + 7) // 8, "big")
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode()
+
+
+class FakeAuth0:
+    """Serves a JWKS for a throwaway RSA key and signs tokens with it."""
+
+    def __init__(self):
+        self.key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        numbers = self.key.public_key().public_numbers()
+        jwks = json.dumps({"keys": [{
+            "kty": "RSA", "kid": "bench", "use": "sig", "alg": "RS256",
+            "n": _b64(numbers.n), "e": _b64(numbers.e),
+        }]}).encode()
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.end_headers()
+                self.wfile.write(jwks)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = HTTPServer(("127.0.0.1", 0), Handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.jwks_url = f"http://127.0.0.1:{self.server.server_port}/.well-known/jwks.json"
+
+    def token(self, sub="bench|user"):
+        pem = self.key.private_bytes(
+            serialization.Encoding.PEM,
+            serialization.PrivateFormat.PKCS8,
+            serialization.NoEncryption(),
+        )
+        claims = {
+            "sub": sub, "aud": AUTH0_AUDIENCE, "iss": f"https://{AUTH0_DOMAIN}/",
+            "iat": int(time.time()), "exp": int(time.time()) + 3600,
+        }
+        return jwt.encode(claims, pem, algorithm="RS256", headers={"kid": "bench"})
+
+
+def percentile(samples, q):
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[max(0, math.ceil(q / 100 * len(ordered)) - 1)]
+
+
+def latencies(samples):
+    return {
+        "count": len(samples),
+        "p50_ms": percentile(samples, 50) * 1000,
+        "p95_ms": percentile(samples, 95) * 1000,
+        "p99_ms": percentile(samples, 99) * 1000,
+    }
+
+
+def summarize(samples, wall_seconds):
+    return {"throughput_rps": len(samples) / wall_seconds, **latencies(samples)}
+
+
+async def run_scenario(client, api_key, scenario, requests, concurrency):
+    samples, errors = defaultdict(list), defaultdict(int)
+    semaphore = asyncio.Semaphore(1 if scenario == "single" else concurrency)
+    headers = {"X-API-Key": api_key}
+
+    async def timed(endpoint, call):
+        start = time.perf_counter()
+        response = await call()
+        samples[endpoint].append(time.perf_counter() - start)
+        if response.status_code >= 400:
+            errors[endpoint] += 1
+        return response
+
+    async def one(index):
+        async with semaphore:
+            response = await timed("/start_event", lambda: client.post("/start_event", headers=headers))
+            if response.status_code >= 400:
+                return
+            form = {
+                "type": "output" if scenario == "mixed" and index % 2 else "input",
+                "userprompt": PROMPT,
+                "systemprompt": SYSTEM_PROMPT,
+                "eventId": response.json()["event_id"],
+            }
+            files = None
+            if scenario == "attachments":
+                form["attachment_file_type"] = "document"
+                files = {"attachments": ("report.txt", PROMPT.encode() * 200, "text/plain")}
+            await timed("/validate", lambda: client.post("/validate", headers=headers, data=form, files=files))
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(index) for index in range(requests)))
+    wall_seconds = time.perf_counter() - start
+    return {
+        endpoint: {**summarize(endpoint_samples, wall_seconds), "errors": errors[endpoint]}
+        for endpoint, endpoint_samples in samples.items()
+    }
+
+
+async def main(args):
+    import httpx
+    from fakeredis import FakeAsyncRedis
+    import config
+    import metrics
+    from main import app
+
+    validator_samples = defaultdict(list)
+    observe = metrics.validator_latency.observe
+
+    def record(value, **labels):
+        validator_samples[labels["validator"]].append(value)
+        observe(value, **labels)
+
+    metrics.validator_latency.observe = record
+    app.state.redis = FakeAsyncRedis(decode_responses=True)
+
+    report = {"mode": args.mode, "requests": args.requests, "concurrency": args.concurrency, "scenarios": {}}
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            response = await client.post(
+                "/register",
+                headers={"Authorization": f"Bearer {args.auth0.token()}"},
+                json={
+                    "input_validators": config.input_validators,
+                    "output_validators": config.output_validators,
+                    "selected_model": "bench",
+                },
+            )
+            response.raise_for_status()
+            api_key = response.json()["api_key"]
+
+            for scenario in args.scenarios:
+                report["scenarios"][scenario] = await run_scenario(
+                    client, api_key, scenario, args.requests, args.concurrency
+                )
+
+    report["validators"] = {
+        name: latencies(samples) for name, samples in sorted(validator_samples.items())
+    }
+    return report
+
+
+def print_report(report):
+    print(f"mode={report['mode']} requests={report['requests']} concurrency={report['concurrency']}")
+    print(f"{'scenario':<12} {'endpoint':<13} {'rps':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'errors':>7}")
+    for scenario, endpoints in report["scenarios"].items():
+        for endpoint, row in endpoints.items():
+            print(
+                f"{scenario:<12} {endpoint:<13} {row['throughput_rps']:>9.1f} {row['p50_ms']:>9.1f} "
+                f"{row['p95_ms']:>9.1f} {row['p99_ms']:>9.1f} {row['errors']:>7}"
+            )
+    print(f"\n{'validator':<20} {'runs':>7} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for name, row in report["validators"].items():
+        print(f"{name:<20} {row['count']:>7} {row['p50_ms']:>9.1f} {row['p95_ms']:>9.1f} {row['p99_ms']:>9.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--mode", choices=["stub", "real"], default="stub")
+    parser.add_argument("--latency-ms", type=float, default=10.0, help="Latency of each stub validator.")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("--database-url", help="Defaults to a temporary SQLite database.")
+    parser.add_argument("--output", help="Also write the report as JSON to this path.")
+    args = parser.parse_args()
+    args.scenarios = [scenario for scenario in args.scenarios.split(",") if scenario]
+
+    workdir = tempfile.mkdtemp(prefix="guardrails-bench-")
+    args.auth0 = FakeAuth0()
+    # Must be set before main/config/database are imported.
+    os.environ.update({
+        "DATABASE_URL": args.database_url or f"sqlite:///{workdir}/bench.db",
+        "AUTH0_DOMAIN": AUTH0_DOMAIN,
+        "AUTH0_AUDI": AUTH0_AUDIENCE,
+        "AUTH0_JWKS_URL": args.auth0.jwks_url,
+        "UPLOAD_FILE_PATH": f"{workdir}/uploads/",
+    })
+    if args.mode == "stub":
+        os.environ["STUB_VALIDATORS_LATENCY_MS"] = str(args.latency_ms)
+
+    report = asyncio.run(main(args))
+    print_report(report)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
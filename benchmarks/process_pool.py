@@ -0,0 +1,65 @@
+"""Compares in-thread and process-pool throughput for CPU-bound validators.
+
+    python benchmarks/process_pool.py --validators RedundantSentences,ValidSQL --workers 4
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import executor
+from config import load_validators
+
+SENTENCES = [
+    "The quarterly report shows revenue growth across every region.",
+    "SELECT id, name FROM customers WHERE created_at > '2024-01-01';",
+    "Visit the dashboard to review the latest deployment metrics.",
+    "def handler(event):\n    return {'status': 200, 'body': event}",
+]
+
+def make_text(size):
+    text = ""
+    while len(text) < size:
+        text += " ".join(SENTENCES) + "\n"
+    return text[:size]
+
+async def drive(validator_names, text, requests, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one():
+        async with semaphore:
+            await executor.run_validators("output", validator_names, text)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(requests)))
+    return requests / (time.perf_counter() - start)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--validators", default="RedundantSentences,ValidSQL,ValidPython,WebSanitization,SecretsPresent")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--text-size", type=int, default=20000)
+    args = parser.parse_args()
+
+    validator_names = args.validators.split(",")
+    text = make_text(args.text_size)
+    load_validators(validator_names)
+
+    thread_rps = asyncio.run(drive(validator_names, text, args.requests, args.concurrency))
+    executor.start_process_pools(validator_names, args.workers)
+    try:
+        process_rps = asyncio.run(drive(validator_names, text, args.requests, args.concurrency))
+    finally:
+        executor.shutdown_process_pools()
+
+    print(f"validators={args.validators} text_size={args.text_size} cpus={os.cpu_count()}")
+    print(f"in-thread:    {thread_rps:8.2f} req/s")
+    print(f"process pool: {process_rps:8.2f} req/s ({args.workers} workers per validator)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,37 @@
+"""Fixed-latency stand-ins for the hub validators, used with STUB_VALIDATORS_LATENCY_MS."""
+import time
+from functools import partial
+from typing import Any, Dict, Optional
+
+from guardrails.validator_base import (
+    FailResult,
+    PassResult,
+    ValidationResult,
+    Validator,
+    register_validator,
+)
+
+# Text containing this marker fails every stub, so failure paths can be exercised too.
+FAIL_MARKER = "STUB_FAIL"
+
+
+class StubValidator(Validator):
+    def __init__(self, latency_ms: float = 10.0, on_fail: Optional[Any] = None, **kwargs):
+        super().__init__(on_fail=on_fail, latency_ms=latency_ms, **kwargs)
+        self.latency = latency_ms / 1000
+
+    def validate(self, value: Any, metadata: Dict = {}) -> ValidationResult:
+        time.sleep(self.latency)
+        if FAIL_MARKER in value:
+            return FailResult(error_message=f"{type(self).__name__} stub failure")
+        return PassResult()
+
+
+def stub_factories(validator_names, latency_ms: float) -> dict:
+    factories = {}
+    for validator_name in validator_names:
+        stub_class = register_validator(name=f"benchmarks/{validator_name}", data_type="string")(
+            type(validator_name, (StubValidator,), {})
+        )
+        factories[validator_name] = partial(stub_class, latency_ms=latency_ms, on_fail="noop")
+    return factories
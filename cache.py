@@ -0,0 +1,88 @@
+import logging
+import os
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from dotenv import load_dotenv
+from rate_limit import limiter
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+PREV_KEYS_CACHE_TTL_S = float(os.getenv("PREV_KEYS_CACHE_TTL_S", 5))
+# Bounds how long a change token survives a write that could not replace it.
+PREV_KEYS_VERSION_TTL_S = int(os.getenv("PREV_KEYS_VERSION_TTL_S", 300))
+PREV_KEYS_VERSION_PREFIX = "prev_keys_version"
+JWKS_CACHE_TTL_S = float(os.getenv("JWKS_CACHE_TTL_S", 600))
+
+
+class TTLCache:
+    """Small per-process LRU cache whose entries also expire after ttl seconds.
+    Writers invalidate the entries they affect; the TTL bounds how long other
+    workers, which never see that invalidation, can serve stale entries."""
+
+    def __init__(self, ttl, maxsize=10000):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, predicate):
+        with self._lock:
+            for key in [key for key in self._entries if predicate(key)]:
+                del self._entries[key]
+
+
+# Keyed by (sub, cursor, limit) -> (version, etag, body)
+prev_keys_cache = TTLCache(PREV_KEYS_CACHE_TTL_S)
+
+
+async def prev_keys_version(sub):
+    """Returns the change token of sub's keys, shared by all workers through Redis and
+    replaced on every write, or None if Redis is unavailable."""
+    if limiter.redis is None:
+        return None
+    key = f"{PREV_KEYS_VERSION_PREFIX}:{sub}"
+    try:
+        pipe = limiter.redis.pipeline(transaction=False)
+        pipe.set(key, secrets.token_hex(8), nx=True, ex=PREV_KEYS_VERSION_TTL_S)
+        pipe.get(key)
+        _, version = await pipe.execute()
+    except Exception:
+        return None
+    return version
+
+
+async def invalidate_prev_keys(sub):
+    prev_keys_cache.invalidate(lambda key: key[0] == sub)
+    if limiter.redis is not None:
+        try:
+            await limiter.redis.set(
+                f"{PREV_KEYS_VERSION_PREFIX}:{sub}", secrets.token_hex(8), ex=PREV_KEYS_VERSION_TTL_S
+            )
+        except Exception as e:
+            logger.warning("Could not replace the prev_keys change token of %s: %r", sub, e)
+
+
+jwks_cache = TTLCache(JWKS_CACHE_TTL_S, maxsize=1)
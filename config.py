@@ -1,45 +1,193 @@
+import os
+import threading
+import time
+from contextlib import nullcontext
+from functools import partial
+from dotenv import load_dotenv
 from guardrails import Guard
-from guardrails.hub import (
-    DetectPII, GibberishText, NSFWText,
-    ProfanityFree, SecretsPresent, ToxicLanguage,
-    DetectJailbreak, FinancialTone, HasUrl,
-    MentionsDrugs, RedundantSentences, ValidJson,
-    ValidPython, ValidURL, ValidSQL, ValidOpenApiSpec, WebSanitization
-)
-
-input_validators = {
-    "DetectPII": DetectPII(on_fail="noop", use_local = True),
-    "SecretsPresent": SecretsPresent(on_fail="noop", use_local = True),
-    "DetectJailbreak": DetectJailbreak(on_fail="noop", use_local = True),
-    "MentionsDrugs": MentionsDrugs(on_fail="noop", use_local = True),
+from deadline import DeadlineExceeded, current_deadline
+from model_server import ModelServerClient, use_model_server
+from metrics import validator_load_time
+
+load_dotenv()
+
+# With MODEL_SERVER_SOCKET set, workers leave model loading to model_server.py
+# and send their inference calls to it; the host process itself stays local.
+MODEL_SERVER_SOCKET = os.getenv("MODEL_SERVER_SOCKET")
+USE_MODEL_SERVER = bool(MODEL_SERVER_SOCKET) and os.getenv("MODEL_SERVER_ROLE") != "host"
+USE_LOCAL_MODELS = not USE_MODEL_SERVER
+# Written by snapshot.py; validators that support it load from here when it exists.
+MODEL_SNAPSHOT_DIR = os.getenv("MODEL_SNAPSHOT_DIR", "")
+# Lets DetectJailbreak skip its costlier sub-models once a prompt is known to fail.
+DETECT_JAILBREAK_CASCADE = os.getenv("DETECT_JAILBREAK_CASCADE", "true").lower() == "true"
+
+input_validators = ["DetectPII", "SecretsPresent", "DetectJailbreak", "MentionsDrugs"]
+
+output_validators = [
+    "DetectPII", "ProfanityFree", "WebSanitization", "GibberishText",
+    "NSFWText", "FinancialTone", "SecretsPresent", "MentionsDrugs",
+    "RedundantSentences", "ToxicLanguage", "ValidPython", "DetectJailbreak",
+    "ValidOpenApiSpec", "ValidJson", "ValidSQL", "ValidURL", "HasUrl",
+]
+
+# STUB_VALIDATORS_LATENCY_MS swaps every hub validator for a fixed-latency stub
+# (see benchmarks/stubs.py) so the service can be benchmarked offline.
+STUB_VALIDATORS_LATENCY_MS = os.getenv("STUB_VALIDATORS_LATENCY_MS")
+
+# Validators are built on first use so that a process only loads the models it
+# actually runs (process-pool workers build a single one). Input and output
+# guards share one instance per name.
+if STUB_VALIDATORS_LATENCY_MS:
+    from benchmarks.stubs import stub_factories
+    validator_factories = stub_factories(
+        dict.fromkeys(input_validators + output_validators), float(STUB_VALIDATORS_LATENCY_MS)
+    )
+else:
+    from guardrails.hub import (
+        DetectPII, GibberishText, NSFWText,
+        ProfanityFree, SecretsPresent, ToxicLanguage,
+        DetectJailbreak, FinancialTone, HasUrl,
+        MentionsDrugs, RedundantSentences, ValidJson,
+        ValidPython, ValidURL, ValidSQL, ValidOpenApiSpec, WebSanitization
+    )
+
+    validator_factories = {
+        "DetectPII": partial(DetectPII, on_fail="noop", use_local = USE_LOCAL_MODELS),
+        "ProfanityFree": partial(ProfanityFree, on_fail="noop", use_local = USE_LOCAL_MODELS),
+        "WebSanitization": partial(WebSanitization, on_fail="noop"),
+        "GibberishText": partial(GibberishText, on_fail="noop", use_local = USE_LOCAL_MODELS),
+        "NSFWText": partial(NSFWText, on_fail="noop", use_local = USE_LOCAL_MODELS),
+        "FinancialTone": partial(FinancialTone, on_fail="noop", use_local = USE_LOCAL_MODELS),
+        "SecretsPresent": partial(SecretsPresent, on_fail="noop", use_local = USE_LOCAL_MODELS),
+        "MentionsDrugs": partial(MentionsDrugs, on_fail="noop", use_local = USE_LOCAL_MODELS),
+        "RedundantSentences": partial(RedundantSentences, on_fail="noop", use_local = USE_LOCAL_MODELS),
+        "ToxicLanguage": partial(ToxicLanguage, on_fail="noop", use_local = USE_LOCAL_MODELS),
+        "ValidPython": partial(ValidPython, on_fail="noop", use_local = USE_LOCAL_MODELS),
+        "DetectJailbreak": partial(DetectJailbreak, on_fail="noop", use_local = USE_LOCAL_MODELS, snapshot_path = MODEL_SNAPSHOT_DIR, cascade = DETECT_JAILBREAK_CASCADE),
+        "ValidOpenApiSpec": partial(ValidOpenApiSpec, on_fail="noop"),
+        "ValidJson": partial(ValidJson, on_fail="noop", use_local = USE_LOCAL_MODELS),
+        "ValidSQL": partial(ValidSQL, on_fail="noop"),
+        "ValidURL": partial(ValidURL, on_fail="noop", use_local = USE_LOCAL_MODELS),
+        "HasUrl": partial(HasUrl, on_fail="noop", use_local = USE_LOCAL_MODELS),
+    }
+
+# Regex/parse validators; fail-fast runs these first until real costs have been measured.
+# RedundantSentences is left out: its pairwise fuzzy matching is CPU-heavy on long texts.
+cheap_validators = {
+    "HasUrl", "SecretsPresent", "ValidJson", "ValidURL", "ValidPython",
+    "ValidSQL", "ValidOpenApiSpec", "WebSanitization", "ProfanityFree",
 }
 
-output_validators = {
-    "DetectPII": DetectPII(on_fail="noop", use_local = True),
-    "ProfanityFree":ProfanityFree(on_fail="noop", use_local = True),
-    "WebSanitization": WebSanitization(on_fail="noop"),
-    "GibberishText": GibberishText(on_fail="noop", use_local = True),
-    "NSFWText": NSFWText(on_fail="noop", use_local = True),
-    "FinancialTone": FinancialTone(on_fail="noop", use_local = True),
-    "SecretsPresent": SecretsPresent(on_fail="noop", use_local = True),
-    "MentionsDrugs": MentionsDrugs(on_fail="noop", use_local = True),
-    "RedundantSentences": RedundantSentences(on_fail="noop", use_local = True),
-    "ToxicLanguage": ToxicLanguage(on_fail="noop", use_local = True),
-    "ValidPython": ValidPython(on_fail="noop", use_local = True),
-    "DetectJailbreak": DetectJailbreak(on_fail="noop", use_local = True),
-    "ValidOpenApiSpec": ValidOpenApiSpec(on_fail="noop"),
-    "ValidJson": ValidJson(on_fail="noop", use_local = True),
-    "ValidSQL": ValidSQL(on_fail="noop"),
-    "ValidURL": ValidURL(on_fail="noop", use_local = True),
-    "HasUrl": HasUrl(on_fail="noop", use_local = True),
+# Validators that drive HF models and fast tokenizers, which aren't safe to call from
+# several threads at once (e.g. "Already borrowed" from the Rust tokenizer). Running
+# locally they take a lock per validator, as the model host gives each its own thread.
+model_validators = {
+    "DetectPII", "GibberishText", "NSFWText", "FinancialTone",
+    "MentionsDrugs", "ToxicLanguage", "DetectJailbreak",
 }
 
-def create_guard(validator_type="input", selected_validators=None):
-    if validator_type == "input": validators_set = [input_validators[validator] for validator in selected_validators]
-    elif validator_type == "output": validators_set = [output_validators[validator] for validator in selected_validators]
+# Validators whose _inference scores a list of texts in one batched call, failing those
+# scored above the validator's threshold (see DetectJailbreak.validate). Stubs take one text.
+list_validators = set() if STUB_VALIDATORS_LATENCY_MS else {"DetectJailbreak"}
+
+_validator_instances = {}
+_validator_locks = {}
+_validator_lock = threading.Lock()
+model_server_client = ModelServerClient(MODEL_SERVER_SOCKET) if USE_MODEL_SERVER else None
+
+def get_validator(validator_name):
+    with _validator_lock:
+        validator = _validator_instances.get(validator_name)
+        if validator is None:
+            start = time.perf_counter()
+            validator = validator_factories[validator_name]()
+            validator_load_time.set(time.perf_counter() - start, validator=validator_name)
+            if USE_MODEL_SERVER and validator.use_local is False:
+                use_model_server(validator, validator_name, model_server_client)
+            elif validator_name in model_validators:
+                _validator_locks[validator_name] = threading.Lock()
+            _validator_instances[validator_name] = validator
+        return validator
+
+def load_validators(validator_names=None):
+    for validator_name in validator_names or validator_factories:
+        get_validator(validator_name)
+
+def resolve_validators(validator_type, selected_validators):
+    if validator_type == "input": allowed = input_validators
+    elif validator_type == "output": allowed = output_validators
     else: raise ValueError("Invalid validator_type. Must be 'input' or 'output'.")
+
+    selected = [validator for validator in selected_validators or [] if validator]
+    unknown = [validator for validator in selected if validator not in allowed]
+    if unknown:
+        raise ValueError(f"Unknown {validator_type} validators: {', '.join(unknown)}")
+    return selected
+
+def create_guard(validator_type="input", selected_validators=None):
+    validators_set = [get_validator(validator) for validator in resolve_validators(validator_type, selected_validators)]
     return Guard(name=f"{validator_type}-dynamic-validator").use_many(*validators_set)
 
+def run_validator(validator_name, text):
+    """Runs a single validator in its own guard and returns (parsed outcome, seconds).
+    The seconds exclude time spent waiting for the validator's lock."""
+    guard = Guard(name=f"{validator_name}-validator").use(get_validator(validator_name))
+    with _validator_locks.get(validator_name) or nullcontext():
+        # The request may have expired while this thread waited for the lock.
+        if current_deadline.get().expired():
+            raise DeadlineExceeded()
+        start = time.perf_counter()
+        validation_outcome = parse_validation_output(guard.parse(text))
+        return validation_outcome, time.perf_counter() - start
+
+def run_list_validator(validator_name, texts):
+    """Scores texts with a validator in list_validators in a single call, e.g. one
+    forward pass, and returns ([parsed outcome per text], seconds)."""
+    validator = get_validator(validator_name)
+    with _validator_locks.get(validator_name) or nullcontext():
+        if current_deadline.get().expired():
+            raise DeadlineExceeded()
+        start = time.perf_counter()
+        scores = validator._inference(list(texts))
+        seconds = time.perf_counter() - start
+    outcomes = []
+    for text, score in zip(texts, scores):
+        passed = score <= validator.threshold
+        failure_reason = f"Score {score} is above the threshold of {validator.threshold}"
+        outcomes.append({
+            "validation_passed": passed,
+            "error": None if passed else failure_reason,
+            "validation_summaries": [] if passed else [{
+                "validator_name": validator_name,
+                "validator_status": "fail",
+                "failure_reason": failure_reason,
+                "error_spans": [],
+            }],
+            "raw_llm_output": text,
+        })
+    return outcomes, seconds
+
+def not_run_summary(validator_name, status, reason):
+    """Summary for a validator that did not produce a result, e.g. "skipped" or "timed_out"."""
+    return {
+        "validator_name": validator_name,
+        "validator_status": status,
+        "failure_reason": reason,
+        "error_spans": [],
+    }
+
+def merge_validation_outputs(text, validation_outcomes):
+    validation_outcomes = [outcome for outcome in validation_outcomes if outcome]
+    return {
+        "validation_passed": all(outcome["validation_passed"] for outcome in validation_outcomes),
+        "error": next((outcome["error"] for outcome in validation_outcomes if outcome["error"]), None),
+        "validation_summaries": [
+            summary for outcome in validation_outcomes
+            for summary in outcome["validation_summaries"]
+        ],
+        "raw_llm_output": validation_outcomes[0]["raw_llm_output"] if validation_outcomes else text,
+    }
+
 def parse_validation_output(validation_outcome):
     if not validation_outcome:
         return []
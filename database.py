@@ -1,10 +1,11 @@
 import os
 from dotenv import load_dotenv
 from sqlalchemy import (
-    Column, Integer, String, Text, 
-    ForeignKey, DateTime, create_engine
+    Column, Integer, BigInteger, Float, String, Text, LargeBinary,
+    ForeignKey, DateTime, Index, create_engine, inspect, text
 )
 from sqlalchemy.dialects.postgresql import JSON
+from sqlalchemy.exc import OperationalError
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, relationship
 from sqlalchemy.sql import func
@@ -12,10 +13,12 @@ from sqlalchemy_utils import database_exists, create_database
 
 load_dotenv()
 
-SQLALCHEMY_DATABASE_URL = f"postgresql://{os.getenv('DATABASE_USER')}:{os.getenv('DATABASE_PASSWORD')}@{os.getenv('DATABASE_HOST')}:{os.getenv('DATABASE_PORT')}/{os.getenv('DATABASE_NAME')}?sslmode=require"
+# DATABASE_URL overrides the Postgres settings, e.g. sqlite:///bench.db for local benchmarks.
+SQLALCHEMY_DATABASE_URL = os.getenv('DATABASE_URL') or f"postgresql://{os.getenv('DATABASE_USER')}:{os.getenv('DATABASE_PASSWORD')}@{os.getenv('DATABASE_HOST')}:{os.getenv('DATABASE_PORT')}/{os.getenv('DATABASE_NAME')}?sslmode=require"
+CONNECT_ARGS = {"check_same_thread": False, "timeout": 30} if SQLALCHEMY_DATABASE_URL.startswith("sqlite") else {}
 
 Base = declarative_base()
-engine = create_engine(SQLALCHEMY_DATABASE_URL)
+engine = create_engine(SQLALCHEMY_DATABASE_URL, connect_args=CONNECT_ARGS)
 if not database_exists(engine.url): create_database(engine.url)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
@@ -35,6 +38,10 @@ class Api(Base):
     input_validators = Column(Text, nullable=False)
     output_validators = Column(Text, nullable=False)
     selected_model = Column(String, nullable=False)
+    validation_policy = Column(String, nullable=False, default="full_report", server_default="full_report")
+
+    # Serves the per-user keyset pages of /prev_keys (WHERE sub = ? AND id > ? ORDER BY id).
+    __table_args__ = (Index("ix_apis_sub_id", "sub", "id"),)
 
 class Event(Base):
     __tablename__ = "events"
@@ -45,4 +52,99 @@ class Event(Base):
     time_stamp = Column(DateTime(timezone=True), server_default=func.now())
     results = Column(JSON, default=[])
 
-Base.metadata.create_all(bind=engine)
+    # Serves per-key scans in id order, e.g. the export endpoint.
+    __table_args__ = (Index("ix_events_api_id_id", "api_id", "id"),)
+
+class ValidationStat(Base):
+    """Hourly per-key, per-validator rollup maintained as results are written (see stats.py)."""
+    __tablename__ = "validation_stats"
+
+    api_id = Column(Integer, primary_key=True)
+    hour = Column(DateTime(timezone=True), primary_key=True)
+    validator_name = Column(String, primary_key=True)
+    passed = Column(Integer, nullable=False, default=0)
+    failed = Column(Integer, nullable=False, default=0)
+    skipped = Column(Integer, nullable=False, default=0)
+    timed_out = Column(Integer, nullable=False, default=0)
+    latency_ms_sum = Column(Float, nullable=False, default=0.0)
+
+class SystemPrompt(Base):
+    """System prompts referenced from events.results by content hash (see storage.py)."""
+    __tablename__ = "system_prompts"
+
+    sha256 = Column(String(64), primary_key=True)
+    text = Column(Text, nullable=False)
+
+class ZstdDictionary(Base):
+    """Trained zstd dictionaries, kept so that every compressed field stays readable."""
+    __tablename__ = "zstd_dictionaries"
+
+    dict_id = Column(BigInteger, primary_key=True)
+    data = Column(LargeBinary, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+class AttachmentJob(Base):
+    """An uploaded attachment waiting for, or done with, background validation (see attachments.py)."""
+    __tablename__ = "attachment_jobs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    job_id = Column(String, unique=True, nullable=False, index=True)
+    api_id = Column(Integer, nullable=False)
+    event_id = Column(String, nullable=False)
+    event_row_id = Column(Integer, nullable=False)
+    file_path = Column(String, nullable=False)
+    file_type = Column(String)
+    callback_url = Column(String)
+    status = Column(String, nullable=False, default="queued")
+    result = Column(JSON)
+    error = Column(Text)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    finished_at = Column(DateTime(timezone=True))
+
+# create_all only creates missing tables; columns added to existing tables go here.
+COLUMN_MIGRATIONS = {
+    "apis": {
+        "validation_policy": "VARCHAR NOT NULL DEFAULT 'full_report'",
+    },
+}
+
+# Likewise for indexes added to existing tables: name -> (table, columns).
+INDEX_MIGRATIONS = {
+    "ix_apis_sub_id": ("apis", "sub, id"),
+    "ix_events_api_id_id": ("events", "api_id, id"),
+}
+
+# Arbitrary key for the Postgres advisory lock that serializes migrations across workers.
+MIGRATION_LOCK_ID = 72110
+
+def migrate():
+    """Creates missing tables, columns and indexes. Workers usually start together, so on
+    Postgres they take an advisory lock and migrate one at a time, and every statement
+    also tolerates having been applied already."""
+    with engine.begin() as connection:
+        postgres = connection.dialect.name == "postgresql"
+        if postgres:
+            connection.execute(text("SELECT pg_advisory_xact_lock(:id)"), {"id": MIGRATION_LOCK_ID})
+        Base.metadata.create_all(bind=connection)
+        inspector = inspect(connection)
+        for table, columns in COLUMN_MIGRATIONS.items():
+            if not inspector.has_table(table):
+                continue
+            existing = {column["name"] for column in inspector.get_columns(table)}
+            for column, ddl in columns.items():
+                if column in existing:
+                    continue
+                if postgres:
+                    connection.execute(text(f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS {column} {ddl}"))
+                    continue
+                # SQLite has no IF NOT EXISTS here; another process may have just added it.
+                try:
+                    connection.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}"))
+                except OperationalError as e:
+                    if "duplicate column" not in str(e):
+                        raise
+        for index, (table, column) in INDEX_MIGRATIONS.items():
+            if inspector.has_table(table):
+                connection.execute(text(f"CREATE INDEX IF NOT EXISTS {index} ON {table} ({column})"))
+
+migrate()
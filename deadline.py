@@ -0,0 +1,81 @@
+import asyncio
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+
+
+class DeadlineExceeded(Exception):
+    pass
+
+
+class Deadline:
+    """A request's time budget, which a client disconnect can also cancel early.
+    Validators check it before starting, and callers stop waiting on running
+    work once it expires."""
+
+    def __init__(self, timeout: Optional[float] = None):
+        self.expires_at = time.monotonic() + timeout if timeout is not None else None
+        self.cancelled = False
+        # Created per event loop: an asyncio.Event binds to the first loop that waits on
+        # it, and module-level deadlines like NO_DEADLINE outlive any one loop.
+        self._cancelled = None
+        self._cancelled_loop = None
+
+    def remaining(self) -> Optional[float]:
+        if self.expires_at is None:
+            return None
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self) -> bool:
+        return self.cancelled or (self.expires_at is not None and time.monotonic() >= self.expires_at)
+
+    def wall_clock(self) -> Optional[float]:
+        """The deadline as a time.time() timestamp, for other processes."""
+        remaining = self.remaining()
+        return None if remaining is None else time.time() + remaining
+
+    def cancel(self):
+        self.cancelled = True
+        if self._cancelled is not None:
+            self._cancelled.set()
+
+    def _cancelled_event(self):
+        loop = asyncio.get_running_loop()
+        if self._cancelled_loop is not loop:
+            self._cancelled = asyncio.Event()
+            self._cancelled_loop = loop
+            if self.cancelled:
+                self._cancelled.set()
+        return self._cancelled
+
+    async def run(self, awaitable):
+        """Awaits awaitable, raising DeadlineExceeded (and cancelling it) if the
+        deadline passes or the request is cancelled first."""
+        if self.expired():
+            raise DeadlineExceeded()
+        task = asyncio.ensure_future(awaitable)
+        cancelled = asyncio.ensure_future(self._cancelled_event().wait())
+        try:
+            done, _ = await asyncio.wait({task, cancelled}, timeout=self.remaining(), return_when=asyncio.FIRST_COMPLETED)
+            if task in done:
+                return task.result()
+            raise DeadlineExceeded()
+        finally:
+            # Also reached when the caller itself is cancelled, e.g. by asyncio.wait_for.
+            cancelled.cancel()
+            task.cancel()
+
+
+NO_DEADLINE = Deadline()
+current_deadline: ContextVar[Deadline] = ContextVar("current_deadline", default=NO_DEADLINE)
+
+
+@contextmanager
+def deadline_scope(deadline: Deadline):
+    """Makes deadline visible to code that can't be handed it, e.g. the model server client."""
+    token = current_deadline.set(deadline)
+    try:
+        yield deadline
+    finally:
+        current_deadline.reset(token)
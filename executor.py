@@ -0,0 +1,230 @@
+import asyncio
+import contextvars
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
+from dotenv import load_dotenv
+import metrics
+from tracing import span
+from config import (
+    cheap_validators, get_validator, merge_validation_outputs,
+    not_run_summary, resolve_validators, run_list_validator, run_validator,
+)
+from deadline import NO_DEADLINE, DeadlineExceeded, deadline_scope
+from runtime import configure_runtime
+
+load_dotenv()
+
+try:
+    # Timing hooks of the vendored DetectJailbreak; importing them doesn't load torch.
+    from guardrails_grhub_detect_jailbreak import TOKENIZATION_STATS, add_forward_observer, tokenization_scope
+except ImportError:
+    # Not installed, e.g. with stub validators: no tokenization metrics.
+    TOKENIZATION_STATS, add_forward_observer, tokenization_scope = None, None, nullcontext
+
+# Pure-Python validators hold the GIL, so threads don't help them. The ones listed
+# here run in their own process pool instead; everything else runs in-thread.
+PROCESS_POOL_VALIDATORS = list(filter(None, os.getenv("PROCESS_POOL_VALIDATORS", "").split(",")))
+PROCESS_POOL_WORKERS = int(os.getenv("PROCESS_POOL_WORKERS", 2))
+
+# Under the fail_fast policy validators whose average cost is below this run together
+# in a first stage; costlier ones then run one at a time, cheapest first.
+FAIL_FAST_CHEAP_COST = float(os.getenv("FAIL_FAST_CHEAP_COST_MS", 20)) / 1000
+COST_SMOOTHING = 0.1
+DEFAULT_CHEAP_COST = 0.005
+DEFAULT_MODEL_COST = 0.5
+
+process_pools = {}
+validator_costs = {}
+
+def record_cost(validator_name, seconds):
+    previous = validator_costs.get(validator_name)
+    validator_costs[validator_name] = seconds if previous is None else previous + COST_SMOOTHING * (seconds - previous)
+
+def estimated_cost(validator_name):
+    if validator_name in validator_costs:
+        return validator_costs[validator_name]
+    return DEFAULT_CHEAP_COST if validator_name in cheap_validators else DEFAULT_MODEL_COST
+
+def _observe_forward(submodel, seconds, batch_size):
+    metrics.submodel_latency.observe(seconds, validator="DetectJailbreak", submodel=submodel)
+    metrics.submodel_batch_size.observe(batch_size, validator="DetectJailbreak", submodel=submodel)
+
+def _tokenization_metrics():
+    stats = TOKENIZATION_STATS.snapshot()
+    collected = []
+    for name, documentation, value in [
+        ("guardrails_tokenization_seconds_total", "Time spent tokenizing.", stats["tokenize_seconds"]),
+        ("guardrails_forward_seconds_total", "Time spent in model forward passes.", stats["forward_seconds"]),
+    ]:
+        counter = metrics.Counter(name, documentation)
+        counter.inc(value)
+        collected.append(counter)
+    return collected
+
+if TOKENIZATION_STATS is not None:
+    add_forward_observer(_observe_forward)
+    metrics.REGISTRY.add_collector(_tokenization_metrics)
+
+def _init_pool_worker(validator_name):
+    # Pool validators are pure Python; torch threads would only compete with the workers.
+    configure_runtime(threads=1, pin=False)
+    get_validator(validator_name)
+
+def _warm_pool_worker():
+    return os.getpid()
+
+def start_process_pools(validator_names=None, workers=None):
+    """Starts one pool per validator name and builds the validator in every worker,
+    so that only the text and the parsed results cross the process boundary."""
+    validator_names = PROCESS_POOL_VALIDATORS if validator_names is None else validator_names
+    workers = workers or PROCESS_POOL_WORKERS
+    context = multiprocessing.get_context("spawn")
+    for validator_name in validator_names:
+        if validator_name in process_pools:
+            continue
+        pool = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=context,
+            initializer=_init_pool_worker,
+            initargs=(validator_name,),
+        )
+        # Submitting one task per worker forces every worker to start and initialize.
+        for future in [pool.submit(_warm_pool_worker) for _ in range(workers)]:
+            future.result()
+        process_pools[validator_name] = pool
+
+def shutdown_process_pools():
+    for validator_name in list(process_pools):
+        process_pools.pop(validator_name).shutdown(wait=False, cancel_futures=True)
+
+def _run_unless_expired(deadline, validator_name, text):
+    # Work queued behind a slow validator may only reach a thread after the deadline.
+    if deadline.expired():
+        raise DeadlineExceeded()
+    return run_validator(validator_name, text)
+
+async def _run_one(validator_name, text, deadline, thread_pool=None):
+    loop = asyncio.get_running_loop()
+    pool = process_pools.get(validator_name)
+    mode = "process" if pool is not None else "thread"
+    start = time.perf_counter()
+    with span(f"validator.{validator_name}", validator=validator_name, mode=mode, text_length=len(text)) as validator_span:
+        try:
+            if pool is not None:
+                # Cancelling the future on expiry keeps a queued run from ever starting.
+                outcome, seconds = await deadline.run(loop.run_in_executor(pool, run_validator, validator_name, text))
+            else:
+                # Copy the context so the thread sees this request's tokenization scope and deadline.
+                context = contextvars.copy_context()
+                outcome, seconds = await deadline.run(loop.run_in_executor(
+                    thread_pool, context.run, _run_unless_expired, deadline, validator_name, text
+                ))
+        except DeadlineExceeded:
+            validator_span.set_attribute("timed_out", True)
+            metrics.validator_calls.inc(validator=validator_name, mode=mode, status="timed_out")
+            raise
+        validator_span.set_attribute("validation_passed", bool(not outcome or outcome["validation_passed"]))
+
+    status = "fail" if outcome and not outcome["validation_passed"] else "pass"
+    metrics.validator_calls.inc(validator=validator_name, mode=mode, status=status)
+    metrics.validator_latency.observe(seconds, validator=validator_name, mode=mode)
+    metrics.validator_queue_time.observe(max(time.perf_counter() - start - seconds, 0.0), validator=validator_name, mode=mode)
+    return outcome, seconds
+
+async def _run_stage(validator_names, text, deadline, thread_pool=None):
+    """Returns ({name: (outcome, seconds)} for finished validators, [timed out names])."""
+    results = await asyncio.gather(
+        *(_run_one(name, text, deadline, thread_pool) for name in validator_names), return_exceptions=True
+    )
+    runs, timed_out = {}, []
+    for name, result in zip(validator_names, results):
+        if isinstance(result, DeadlineExceeded):
+            timed_out.append(name)
+        elif isinstance(result, BaseException):
+            raise result
+        else:
+            record_cost(name, result[1])
+            runs[name] = result
+    return runs, timed_out
+
+def _fail_fast_stages(validator_names):
+    ordered = sorted(validator_names, key=estimated_cost)
+    cheap = [name for name in ordered if estimated_cost(name) <= FAIL_FAST_CHEAP_COST]
+    return ([cheap] if cheap else []) + [[name] for name in ordered if name not in cheap]
+
+async def run_validators(validator_type, selected_validators, text, policy="full_report", deadline=NO_DEADLINE, thread_pool=None):
+    """Runs the selected validators and merges their outcomes. Validators that run
+    in-thread use thread_pool, or the loop's default executor when it is None.
+    With the full_report policy all of them run concurrently. With fail_fast they run
+    in order of measured cost and the rest are reported as skipped after a failure.
+    Validators that have not finished when the deadline expires are reported as
+    timed_out and the outcome holds the partial results.
+    Returns (validation outcome, {validator name: (status, seconds)}), where status is
+    pass, fail, skipped or timed_out and seconds is None for validators that did not run."""
+    with span("resolve_validators", validator_type=validator_type):
+        validator_names = resolve_validators(validator_type, selected_validators)
+    runs, skipped, timed_out = {}, [], []
+    with span("guard_parse", text_length=len(text), validator_count=len(validator_names), policy=policy) as parse_span, \
+            tokenization_scope() as tokenization, deadline_scope(deadline):
+        if policy == "fail_fast":
+            stages = _fail_fast_stages(validator_names)
+            for index, stage in enumerate(stages):
+                stage_runs, stage_timed_out = await _run_stage(stage, text, deadline, thread_pool)
+                runs.update(stage_runs)
+                timed_out.extend(stage_timed_out)
+                if deadline.expired():
+                    timed_out.extend(name for later in stages[index + 1:] for name in later)
+                    break
+                if any(outcome and not outcome["validation_passed"] for outcome, _ in runs.values()):
+                    skipped = [name for later in stages[index + 1:] for name in later]
+                    break
+        else:
+            runs, timed_out = await _run_stage(validator_names, text, deadline, thread_pool)
+        if tokenization is not None:
+            parse_span.set_attribute("tokenization.seconds", tokenization.tokenize_seconds)
+            parse_span.set_attribute("forward.seconds", tokenization.forward_seconds)
+        parse_span.set_attribute("skipped_count", len(skipped))
+        parse_span.set_attribute("timed_out_count", len(timed_out))
+
+    validation_outcome = merge_validation_outputs(text, [outcome for outcome, _ in runs.values()])
+    for name in skipped:
+        metrics.validator_calls.inc(validator=name, mode="none", status="skipped")
+    validation_outcome["validation_summaries"].extend(
+        not_run_summary(name, "skipped", "Skipped by the fail_fast policy after an earlier validator failed")
+        for name in skipped
+    )
+    if timed_out:
+        reason = "Request was cancelled" if deadline.cancelled else "Deadline exceeded before the validator finished"
+        validation_outcome["validation_passed"] = False
+        validation_outcome["error"] = validation_outcome["error"] or f"{len(timed_out)} validators timed out"
+        validation_outcome["validation_summaries"].extend(
+            not_run_summary(name, "timed_out", reason) for name in timed_out
+        )
+    statuses = {
+        name: ("fail" if outcome and not outcome["validation_passed"] else "pass", seconds)
+        for name, (outcome, seconds) in runs.items()
+    }
+    statuses.update((name, ("skipped", None)) for name in skipped)
+    statuses.update((name, ("timed_out", None)) for name in timed_out)
+    return validation_outcome, statuses
+
+async def run_list_validators(validator_names, texts, thread_pool=None):
+    """Runs each of validator_names, which must be list_validators, once over all of
+    texts. Returns [{validator name: (outcome, seconds)} per text], where seconds is
+    the text's share of the call."""
+    loop = asyncio.get_running_loop()
+    runs = [{} for _ in texts]
+    for validator_name in validator_names:
+        with span(f"validator.{validator_name}", validator=validator_name, mode="list", batch_size=len(texts)):
+            outcomes, seconds = await loop.run_in_executor(
+                thread_pool, contextvars.copy_context().run, run_list_validator, validator_name, texts
+            )
+        metrics.validator_latency.observe(seconds, validator=validator_name, mode="list")
+        for run, outcome in zip(runs, outcomes):
+            status = "pass" if outcome["validation_passed"] else "fail"
+            metrics.validator_calls.inc(validator=validator_name, mode="list", status=status)
+            run[validator_name] = (outcome, seconds / len(texts))
+    return runs
@@ -0,0 +1,111 @@
+import io
+import json
+import os
+from dotenv import load_dotenv
+from database import SessionLocal, Event
+from storage import expand_result
+
+load_dotenv()
+
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", 1000))
+EXPORT_FORMATS = {
+    "ndjson": "application/x-ndjson",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+
+def export_rows(api_id, since_id=None, start=None, end=None):
+    """Yields a key's events in id order. Rows come from a server-side cursor in
+    batches of EXPORT_BATCH_SIZE, so memory stays flat however large the range.
+    The generator owns its session because it outlives the request's dependencies."""
+    db = SessionLocal()
+    try:
+        query = (
+            db.query(Event.id, Event.event_id, Event.time_stamp, Event.results)
+            .filter(Event.api_id == api_id)
+        )
+        if since_id is not None:
+            query = query.filter(Event.id > since_id)
+        if start is not None:
+            query = query.filter(Event.time_stamp >= start)
+        if end is not None:
+            query = query.filter(Event.time_stamp < end)
+        for id, event_id, time_stamp, results in query.order_by(Event.id).yield_per(EXPORT_BATCH_SIZE):
+            yield {
+                "id": id,
+                "event_id": event_id,
+                "time_stamp": time_stamp.isoformat() if time_stamp else None,
+                "results": [expand_result(db, result) for result in results or []],
+            }
+    finally:
+        db.close()
+
+
+def ndjson(rows):
+    batch = []
+    for row in rows:
+        batch.append(json.dumps(row) + "\n")
+        if len(batch) >= EXPORT_BATCH_SIZE:
+            yield "".join(batch)
+            batch = []
+    if batch:
+        yield "".join(batch)
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only file that hands back what was written since the last drain,
+    while reporting the absolute position the Parquet footer offsets depend on."""
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def drain(self):
+        data, self.chunks = b"".join(self.chunks), []
+        return data
+
+
+def parquet(rows):
+    """One row group per EXPORT_BATCH_SIZE events; results are kept as a JSON string column."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema([
+        ("id", pa.int64()),
+        ("event_id", pa.string()),
+        ("time_stamp", pa.string()),
+        ("results", pa.string()),
+    ])
+    sink = _ChunkSink()
+    writer = pq.ParquetWriter(sink, schema, compression="zstd")
+
+    def write(batch):
+        writer.write_table(pa.Table.from_pylist(batch, schema=schema))
+        return sink.drain()
+
+    batch = []
+    for row in rows:
+        batch.append({**row, "results": json.dumps(row["results"])})
+        if len(batch) >= EXPORT_BATCH_SIZE:
+            yield write(batch)
+            batch = []
+    if batch:
+        yield write(batch)
+    writer.close()
+    yield sink.drain()
+
+
+def export_stream(format, api_id, since_id=None, start=None, end=None):
+    rows = export_rows(api_id, since_id, start, end)
+    return ndjson(rows) if format == "ndjson" else parquet(rows)
@@ -1,63 +1,111 @@
 import os
 import re
+import asyncio
+import hashlib
 import json
+import logging
 import secrets
+import threading
+import time
 import uuid
 from dotenv import load_dotenv
 from fastapi import (
     FastAPI, Security, HTTPException, Depends, 
-    status, Header, Form, File, UploadFile
+    status, Header, Form, File, UploadFile, Request, Query
 )
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from fastapi.security.api_key import APIKeyHeader
-from fastapi_limiter import FastAPILimiter
-from fastapi_limiter.depends import RateLimiter
 from jose import jwt
-import redis.asyncio as redis
 import requests
+from sqlalchemy import func
 from sqlalchemy.orm import Session as SQLASession
-from typing import Optional, Union
-from config import create_guard, parse_validation_output
-from models import ValidationRequest, RegistrationRequest, KeyDeletionRequest
-from database import Api, Event as UserSession, get_db
+from datetime import datetime
+from functools import partial
+from typing import Literal, Optional, Union
+from fastapi.concurrency import run_in_threadpool
+from config import USE_MODEL_SERVER, load_validators
+from runtime import configure_runtime
+from admission import admission
+from attachments import attachment_pipeline, check_callback_url, job_payload, remove_upload, write_upload
+from cache import invalidate_prev_keys, jwks_cache, prev_keys_cache, prev_keys_version
+from deadline import Deadline, DeadlineExceeded
+from rate_limit import RateLimiter, limiter
+from export import EXPORT_FORMATS, export_stream
+from stats import record_validation_stats, validation_stats
+from storage import compact_result
+from executor import run_validators, start_process_pools, shutdown_process_pools
+from metrics import REGISTRY
+from tracing import SERVER_TIMING, server_timing, span, trace
+from models import (
+    ValidationRequest, RegistrationRequest, BulkRegistrationRequest,
+    KeyUpdateRequest, KeyDeletionRequest
+)
+from database import Api, AttachmentJob, Event as UserSession, get_db
 from auth import get_validators, verify_key, verify_session
 from pyngrok import ngrok
 import uvicorn
 
 load_dotenv()
+logging.basicConfig(level=os.getenv("LOG_LEVEL", "WARNING").upper())
 app = FastAPI()
 bearer_scheme = HTTPBearer()
 ALGORITHMS = ["RS256"]
 AUTH0_DOMAIN = os.getenv('AUTH0_DOMAIN')
+AUTH0_JWKS_URL = os.getenv('AUTH0_JWKS_URL') or f"https://{AUTH0_DOMAIN}/.well-known/jwks.json"
 UPLOAD_FILE_PATH = os.getenv('UPLOAD_FILE_PATH')
+PREV_KEYS_PAGE_SIZE = int(os.getenv('PREV_KEYS_PAGE_SIZE', 50))
+PREV_KEYS_MAX_PAGE_SIZE = 500
+DISCONNECT_POLL_INTERVAL = float(os.getenv('DISCONNECT_POLL_INTERVAL_MS', 100)) / 1000
 API_KEY_HEADER = APIKeyHeader(name="X-API-Key", auto_error=False)
+JWKS_MIN_REFRESH_S = float(os.getenv('JWKS_MIN_REFRESH_S', 60))
+jwks_fetched_at = float("-inf")
+jwks_fetch_lock = threading.Lock()
 
-def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(bearer_scheme)):
-    try:
-        token = credentials.credentials
-
-        jwks_url = f"https://{AUTH0_DOMAIN}/.well-known/jwks.json"
-        jwks_response = requests.get(jwks_url)
+def get_jwks(refresh: bool = False):
+    """Returns the cached JWKS. refresh asks for a fresh copy, but Auth0 is asked at
+    most once every JWKS_MIN_REFRESH_S, so tokens with made-up kids can't turn every
+    request into a fetch."""
+    global jwks_fetched_at
+    jwks = jwks_cache.get(AUTH0_JWKS_URL)
+    with jwks_fetch_lock:
+        now = time.monotonic()
+        if refresh and now - jwks_fetched_at >= JWKS_MIN_REFRESH_S:
+            jwks = None
+        if jwks is None:
+            jwks_fetched_at = now
+    if jwks is None:
+        jwks_response = requests.get(AUTH0_JWKS_URL)
         jwks_response.raise_for_status()
         jwks = jwks_response.json()
-        
+        jwks_cache.set(AUTH0_JWKS_URL, jwks)
+    return jwks
+
+def find_rsa_key(jwks, kid):
+    return next(
+        (
+            {
+                "kty": key["kty"],
+                "kid": key["kid"],
+                "use": key["use"],
+                "n": key["n"],
+                "e": key["e"]
+            }
+            for key in jwks["keys"] if key["kid"] == kid
+        ),
+        None
+    )
 
+def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(bearer_scheme)):
+    try:
+        token = credentials.credentials
         unverified_header = jwt.get_unverified_header(token)
 
-        rsa_key = next(
-            (
-                {
-                    "kty": key["kty"],
-                    "kid": key["kid"],
-                    "use": key["use"],
-                    "n": key["n"],
-                    "e": key["e"]
-                }
-                for key in jwks["keys"]
-            ),
-            None
-        )
+        rsa_key = find_rsa_key(get_jwks(), unverified_header.get("kid"))
+        if not rsa_key:
+            # Auth0 may have rotated its signing key since the JWKS was cached.
+            rsa_key = find_rsa_key(get_jwks(refresh=True), unverified_header.get("kid"))
         if not rsa_key:
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED, 
@@ -91,43 +139,155 @@ def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(bearer_
             detail="Invalid token"
         )
 
+@app.middleware("http")
+async def trace_requests(request: Request, call_next):
+    with trace(f"{request.method} {request.url.path}", **{"http.method": request.method, "http.route": request.url.path}) as (root, spans):
+        response = await call_next(request)
+        root.set_attribute("http.status_code", response.status_code)
+    if SERVER_TIMING:
+        response.headers["Server-Timing"] = server_timing(spans, root)
+    return response
+
 @app.on_event("startup")
 async def startup_event():
-    redis_con = redis.from_url("redis://localhost", encoding="utf-8", decode_responses=True)
-    await FastAPILimiter.init(redis_con)
+    # The benchmark harness provides its own client (fakeredis) through app.state.
+    await limiter.start(getattr(app.state, "redis", None))
+    # Pool processes inherit the CPU affinity, so they start before this worker pins itself.
+    await run_in_threadpool(start_process_pools)
+    # Workers backed by the model server do no inference of their own.
+    configure_runtime(threads=1 if USE_MODEL_SERVER else None)
+    await run_in_threadpool(load_validators)
+    await attachment_pipeline.start()
 
-@app.post("/register", dependencies=[Depends(RateLimiter(times=5, seconds=60))])
-async def register_user(data: RegistrationRequest, db: SQLASession = Depends(get_db), user=Depends(get_current_user)):
-    api_key = secrets.token_hex(16)
-    new_key = Api(
-        sub=user["sub"],
-        api_key=api_key,
+@app.on_event("shutdown")
+async def shutdown_event():
+    await attachment_pipeline.stop()
+    shutdown_process_pools()
+    await limiter.stop()
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+def new_api_key(sub: str, data: RegistrationRequest):
+    return Api(
+        sub=sub,
+        api_key=secrets.token_hex(16),
         input_validators=",".join(data.input_validators),
         output_validators=",".join(data.output_validators),
-        selected_model=data.selected_model
+        selected_model=data.selected_model,
+        validation_policy=data.validation_policy,
     )
+
+@app.post("/register", dependencies=[Depends(RateLimiter(times=5, seconds=60))])
+async def register_user(data: RegistrationRequest, db: SQLASession = Depends(get_db), user=Depends(get_current_user)):
+    new_key = new_api_key(user["sub"], data)
+    api_key = new_key.api_key
     db.add(new_key)
     db.commit()
+    await invalidate_prev_keys(user["sub"])
     return {"api_key": api_key}
 
-@app.get("/prev_keys", dependencies=[Depends(RateLimiter(times=1000, seconds=60))])
-async def get_prev_apis(db: SQLASession = Depends(get_db), user=Depends(get_current_user)):
-    existing_keys = db.query(Api).filter(Api.sub == user["sub"]).all()
+@app.post("/register/bulk", dependencies=[Depends(RateLimiter(times=5, seconds=60))])
+async def register_bulk(data: BulkRegistrationRequest, db: SQLASession = Depends(get_db), user=Depends(get_current_user)):
+    new_keys = [new_api_key(user["sub"], key) for key in data.keys]
+    api_keys = [key.api_key for key in new_keys]
+    try:
+        # All or nothing: a failure part way leaves no keys behind.
+        db.add_all(new_keys)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise HTTPException(
+            status_code=500,
+            detail="An error occurred while creating the API keys"
+        )
+    await invalidate_prev_keys(user["sub"])
+    return {"api_keys": api_keys}
 
-    if not existing_keys:
+@app.patch("/keys/{key_id}", dependencies=[Depends(RateLimiter(times=1000, seconds=60))])
+async def update_key(key_id: int, data: KeyUpdateRequest, db: SQLASession = Depends(get_db), user=Depends(get_current_user)):
+    existing_key = db.query(Api).filter(Api.id == key_id, Api.sub == user["sub"]).first()
+    if not existing_key:
+        raise HTTPException(
+            status_code=404,
+            detail="API key not found or you do not have permission to update this key"
+        )
+
+    updates = data.dict(exclude_none=True)
+    if not updates:
+        raise HTTPException(status_code=400, detail="Nothing to update")
+    for field, value in updates.items():
+        setattr(existing_key, field, ",".join(value) if isinstance(value, list) else value)
+    db.commit()
+    await invalidate_prev_keys(user["sub"])
+    return {"status": "success", "key_id": str(key_id)}
+
+def prev_keys_page(db: SQLASession, sub: str, cursor: Optional[int], limit: int):
+    # Only the columns the dashboard shows, read off the ix_apis_sub_id index one page past the cursor.
+    rows = (
+        db.query(
+            Api.id,
+            func.substr(Api.api_key, 1, 4),
+            Api.input_validators,
+            Api.output_validators,
+            Api.selected_model,
+            Api.validation_policy,
+        )
+        .filter(Api.sub == sub, Api.id > (cursor or 0))
+        .order_by(Api.id)
+        .limit(limit + 1)
+        .all()
+    )
+    if not rows and cursor is None:
         return {"message": "No API keys found for this user"}
 
     api_keys_data = [
         {
-            "key_id": str(key.id),
-            "api_key": key.api_key[:4],
-            "input_validators": key.input_validators.split(","),
-            "output_validators": key.output_validators.split(","),
-            "selected_model": key.selected_model,
+            "key_id": str(key_id),
+            "api_key": key_prefix,
+            "input_validators": input_validators.split(","),
+            "output_validators": output_validators.split(","),
+            "selected_model": selected_model,
+            "validation_policy": validation_policy,
         }
-        for key in existing_keys
+        for key_id, key_prefix, input_validators, output_validators, selected_model, validation_policy in rows[:limit]
     ]
-    return {"api_keys": api_keys_data}
+    next_cursor = api_keys_data[-1]["key_id"] if len(rows) > limit else None
+    return {"api_keys": api_keys_data, "next_cursor": next_cursor}
+
+def etag_matches(if_none_match: Optional[str], etag: str):
+    return bool(if_none_match) and etag in [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+
+@app.get("/prev_keys", dependencies=[Depends(RateLimiter(times=1000, seconds=60))])
+async def get_prev_apis(
+    cursor: Optional[int] = Query(None, ge=0),
+    limit: int = Query(PREV_KEYS_PAGE_SIZE, ge=1, le=PREV_KEYS_MAX_PAGE_SIZE),
+    if_none_match: Optional[str] = Header(None),
+    db: SQLASession = Depends(get_db),
+    user=Depends(get_current_user),
+):
+    cache_key = (user["sub"], cursor, limit)
+    version = await prev_keys_version(user["sub"])
+    if version is not None:
+        # Derived from the shared change token, so a page the client already has is
+        # confirmed without a query, however long ago it was fetched.
+        etag = '"%s"' % hashlib.sha256(f"{version}:{cursor}:{limit}".encode()).hexdigest()[:32]
+        if etag_matches(if_none_match, etag):
+            return Response(status_code=304, headers={"ETag": etag})
+    cached = prev_keys_cache.get(cache_key)
+    if cached is None or cached[0] != version:
+        body = prev_keys_page(db, user["sub"], cursor, limit)
+        if version is None:
+            # Without Redis each worker tags pages by content, served from its cache for the TTL.
+            etag = '"%s"' % hashlib.sha256(json.dumps(body, sort_keys=True).encode()).hexdigest()[:32]
+        cached = (version, etag, body)
+        prev_keys_cache.set(cache_key, cached)
+    _, etag, body = cached
+
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    return JSONResponse(body, headers={"ETag": etag})
 
 @app.get("/validators", dependencies=[Depends(RateLimiter(times=1000, seconds=60))])
 async def get_all_validators(validators=Depends(get_validators),):
@@ -137,9 +297,27 @@ async def get_all_validators(validators=Depends(get_validators),):
         "output_validators": validators["output_validators"]
     }
 
+@app.get("/keys/{key_id}/stats", dependencies=[Depends(RateLimiter(times=1000, seconds=60))])
+async def get_key_stats(
+    key_id: int,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    db: SQLASession = Depends(get_db),
+    user=Depends(get_current_user),
+):
+    if not db.query(Api.id).filter(Api.id == key_id, Api.sub == user["sub"]).first():
+        raise HTTPException(
+            status_code=404,
+            detail="API key not found or you do not have permission to view this key"
+        )
+    try:
+        return {"key_id": str(key_id), "stats": validation_stats(db, key_id, start, end)}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
 @app.post("/delete_keys", dependencies=[Depends(RateLimiter(times=1000, seconds=60))])
 async def delete_prev_key(data: KeyDeletionRequest, db: SQLASession = Depends(get_db), user=Depends(get_current_user)):
-    existing_key = db.query(Api).filter(Api.id == data.key_id).first()
+    existing_key = db.query(Api).filter(Api.id == data.key_id, Api.sub == user["sub"]).first()
 
     if not existing_key:
         raise HTTPException(
@@ -150,6 +328,7 @@ async def delete_prev_key(data: KeyDeletionRequest, db: SQLASession = Depends(ge
     try:
         db.delete(existing_key)
         db.commit()
+        await invalidate_prev_keys(user["sub"])
         return {
             "status": "success", 
             "message": "API key successfully deleted"
@@ -177,8 +356,16 @@ async def start_event(api_key = Depends(verify_key), db: SQLASession = Depends(g
     return {"event_id": event_id}
 
 
+async def cancel_on_disconnect(request: Request, deadline: Deadline):
+    while not deadline.expired():
+        if await request.is_disconnected():
+            deadline.cancel()
+            return
+        await asyncio.sleep(DISCONNECT_POLL_INTERVAL)
+
 @app.post("/validate", dependencies=[Depends(RateLimiter(times=1000000000, seconds=86400))])
 async def validation_endpoint(
+    http_request: Request,
     type: str = Form(...),
     userprompt: str = Form(...),
     systemprompt: str = Form(...),
@@ -186,11 +373,19 @@ async def validation_endpoint(
     attachments: Optional[UploadFile] = File(None),
     attachment_file_path: Optional[str] = Form(None),
     attachment_file_type: Optional[str] = Form(None),
+    attachment_callback_url: Optional[str] = Form(None),
     db: SQLASession = Depends(get_db),
     validators=Depends(get_validators),
     api_key: str = Depends(API_KEY_HEADER),
+    deadline_ms: Optional[float] = Header(None, alias="X-Deadline-Ms"),
 ):
+    if deadline_ms is not None and deadline_ms <= 0:
+        raise HTTPException(status_code=400, detail="X-Deadline-Ms must be positive")
+    deadline = Deadline(deadline_ms / 1000 if deadline_ms is not None else None)
+    disconnect_watcher = asyncio.create_task(cancel_on_disconnect(http_request, deadline))
     try:
+        # Shed load before touching the database if inference couldn't start in time.
+        admission.check(api_key, deadline.remaining())
         request_dict = {
             "type": type,
             "userprompt": userprompt,
@@ -198,54 +393,126 @@ async def validation_endpoint(
             "eventId": eventId,
             "attachments": attachments,
             "attachment_file_path": attachment_file_path,
-            "attachment_file_type": attachment_file_type
+            "attachment_file_type": attachment_file_type,
+            "attachment_callback_url": attachment_callback_url,
         }
         
         request = ValidationRequest(**{k: v for k, v in request_dict.items() if v is not None})
-        event = db.query(UserSession).filter(UserSession.event_id == eventId).first()
-        verification = await verify_session(event_id=eventId, api_key=api_key, db=db)
-        if not event or not verification:
+        with span("verify_session"):
+            event = await verify_session(event_id=eventId, api_id=validators["api_id"], db=db)
+        if not event:
             raise HTTPException(status_code=400, detail="Invalid session ID")
 
-        event = UserSession(
-            event_id=request.eventId,
-            api_id=db.query(Api).filter(Api.api_key == api_key).first().id,
-            results=[],
-        )
-        db.add(event)
-        db.commit()
+        with span("event_insert"):
+            event = UserSession(
+                event_id=request.eventId,
+                api_id=validators["api_id"],
+                results=[],
+            )
+            db.add(event)
+            db.commit()
         attachment_file_path = None
+        attachment_job_id = None
         if request.attachments:
+            if request.attachment_callback_url:
+                try:
+                    await run_in_threadpool(check_callback_url, request.attachment_callback_url)
+                except ValueError as e:
+                    raise HTTPException(status_code=400, detail=str(e))
+            # Held until the job is queued, so the queue can't fill up while the upload is written.
+            if not attachment_pipeline.reserve():
+                raise HTTPException(
+                    status_code=503,
+                    detail="Too many attachments waiting for validation, retry later",
+                    headers={"Retry-After": "5"},
+                )
             filename = str(uuid.uuid4())+request.attachments.filename
             attachment_file_path = f"{UPLOAD_FILE_PATH}{filename}"
-            os.makedirs(os.path.dirname(attachment_file_path), exist_ok=True)
-            
-            with open(attachment_file_path, "wb") as f:
-                content = await request.attachments.read()
-                f.write(content)
-        if(request.type == "input"): guard = create_guard(selected_validators=validators["input_validators"], validator_type="input")
-        else: guard = create_guard(selected_validators=validators["output_validators"], validator_type="output")
-        validation_outcome = parse_validation_output(
-            guard.parse(f"{request.userprompt}\n{request.systemprompt}"),
+            try:
+                with span("attachment_write") as attachment_span:
+                    size = await run_in_threadpool(write_upload, request.attachments.file, attachment_file_path)
+                    attachment_span.set_attribute("attachment.size", size)
+                # Extraction and validation happen in the background; poll /attachments/{job_id}.
+                attachment_job_id = attachment_pipeline.submit(
+                    db, validators["api_id"], event, attachment_file_path,
+                    request.attachment_file_type, request.attachment_callback_url,
+                )
+            except BaseException:
+                remove_upload(attachment_file_path)
+                raise
+            finally:
+                attachment_pipeline.release()
+        validate = partial(
+            run_validators,
+            request.type,
+            validators[f"{request.type}_validators"],
+            f"{request.userprompt}\n{request.systemprompt}",
+            policy=validators["validation_policy"],
+            deadline=deadline,
         )
-        results = event.results or []
-        results.append({
-            "type": request.type,
-            "userprompt": request.userprompt,
-            "systemprompt": request.systemprompt,
-            "validation_outcome": validation_outcome,
-            "attachment_file_path": attachment_file_path,
-            "attachment_file_type": request.attachment_file_type,
-        })
-        event.results = results
-        db.commit()
+        try:
+            async with admission.admit(api_key, deadline):
+                validation_outcome, validator_statuses = await validate()
+        except DeadlineExceeded:
+            # Expired or cancelled while queued: with the deadline gone no validator
+            # starts, and every one is reported as timed_out.
+            validation_outcome, validator_statuses = await validate()
+        response = {"validation_outcome": validation_outcome}
+        if attachment_job_id:
+            response["attachment_job_id"] = attachment_job_id
+        if deadline.cancelled:
+            # The client is gone; nobody will read the response or look for the results.
+            return response
+        with span("persist_results"):
+            # The attachment pipeline may have added its entry meanwhile.
+            db.refresh(event, with_for_update=True)
+            # A new list: JSON columns aren't mutation-tracked, so appending to the
+            # loaded list and assigning it back would not be seen as a change.
+            event.results = [*(event.results or []), compact_result(db, {
+                "type": request.type,
+                "userprompt": request.userprompt,
+                "systemprompt": request.systemprompt,
+                "validation_outcome": validation_outcome,
+                "attachment_file_path": attachment_file_path,
+                "attachment_file_type": request.attachment_file_type,
+            })]
+            record_validation_stats(db, validators["api_id"], validator_statuses)
+            db.commit()
 
-        return {"validation_outcome": validation_outcome}
+        return response
 
+    except HTTPException:
+        raise
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"An unexpected error occurred: {str(e)}")
+    finally:
+        disconnect_watcher.cancel()
+
+@app.get("/attachments/{job_id}", dependencies=[Depends(RateLimiter(times=1000, seconds=60))])
+async def get_attachment_job(job_id: str, db: SQLASession = Depends(get_db), validators=Depends(get_validators)):
+    job = db.query(AttachmentJob).filter(
+        AttachmentJob.job_id == job_id, AttachmentJob.api_id == validators["api_id"]
+    ).first()
+    if not job:
+        raise HTTPException(status_code=404, detail="Attachment job not found")
+    return job_payload(job)
+
+@app.get("/export", dependencies=[Depends(RateLimiter(times=60, seconds=60))])
+async def export_events(
+    format: Literal["ndjson", "parquet"] = "ndjson",
+    since_id: Optional[int] = Query(None, ge=0),
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    validators=Depends(get_validators),
+):
+    # For incremental exports pass the largest id already fetched as since_id.
+    return StreamingResponse(
+        export_stream(format, validators["api_id"], since_id, start, end),
+        media_type=EXPORT_FORMATS[format],
+        headers={"Content-Disposition": f'attachment; filename="events.{format}"'},
+    )
 
 # ngrok.set_auth_token(os.getenv('NGROK_API_TOKEN'))
 # public_url = str(ngrok.connect(8000, domain=os.getenv('NGROK_STATIC_DOMAIN')))
@@ -255,6 +522,6 @@ app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
     allow_credentials=True,
-    allow_methods=["GET", "POST", "PUT", "DELETE", "OPTIONS"],
+    allow_methods=["GET", "POST", "PUT", "PATCH", "DELETE", "OPTIONS"],
     allow_headers=["*"],
 )
\ No newline at end of file
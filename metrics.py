@@ -0,0 +1,125 @@
+import threading
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+BATCH_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128)
+
+
+def _format_labels(labelnames, labelvalues, extra=()):
+    pairs = list(zip(labelnames, labelvalues)) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (
+        (name, str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"'))
+        for name, value in pairs
+    )
+    return "{" + ",".join(f'{name}="{value}"' for name, value in escaped) + "}"
+
+
+class Metric:
+    type = ""
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _key(self, labels):
+        return tuple(labels.get(name, "") for name in self.labelnames)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        with self._lock:
+            for labelvalues, value in sorted(self._values.items()):
+                lines.extend(self._samples(labelvalues, value))
+        return lines
+
+    def _samples(self, labelvalues, value):
+        return [f"{self.name}{_format_labels(self.labelnames, labelvalues)} {value}"]
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    type = "gauge"
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts, total, observations = self._values.get(key, ((0,) * len(self.buckets), 0.0, 0))
+            counts = tuple(count + (value <= bound) for count, bound in zip(counts, self.buckets))
+            self._values[key] = (counts, total + value, observations + 1)
+
+    def _samples(self, labelvalues, value):
+        counts, total, observations = value
+        samples = [
+            f"{self.name}_bucket{_format_labels(self.labelnames, labelvalues, [('le', bound)])} {count}"
+            for bound, count in zip(self.buckets, counts)
+        ]
+        samples.append(f"{self.name}_bucket{_format_labels(self.labelnames, labelvalues, [('le', '+Inf')])} {observations}")
+        samples.append(f"{self.name}_sum{_format_labels(self.labelnames, labelvalues)} {total}")
+        samples.append(f"{self.name}_count{_format_labels(self.labelnames, labelvalues)} {observations}")
+        return samples
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+        self.collectors = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def add_collector(self, collector):
+        """collector() is called on every scrape and returns extra Metric objects."""
+        self.collectors.append(collector)
+
+    def render(self):
+        metrics = list(self.metrics)
+        for collector in self.collectors:
+            metrics.extend(collector())
+        return "\n".join(line for metric in metrics for line in metric.render()) + "\n"
+
+
+REGISTRY = Registry()
+
+validator_calls = REGISTRY.register(Counter(
+    "guardrails_validator_calls_total", "Validator runs by outcome.", ["validator", "mode", "status"]
+))
+validator_latency = REGISTRY.register(Histogram(
+    "guardrails_validator_latency_seconds", "Time spent running a validator.", ["validator", "mode"]
+))
+validator_queue_time = REGISTRY.register(Histogram(
+    "guardrails_validator_queue_seconds", "Time a validator run waited for a thread or pool worker.", ["validator", "mode"]
+))
+validator_load_time = REGISTRY.register(Gauge(
+    "guardrails_validator_load_seconds", "Time spent building a validator and loading its models.", ["validator"]
+))
+submodel_latency = REGISTRY.register(Histogram(
+    "guardrails_submodel_forward_seconds", "Forward pass time per sub-model.", ["validator", "submodel"]
+))
+submodel_batch_size = REGISTRY.register(Histogram(
+    "guardrails_submodel_batch_size", "Number of texts per sub-model forward pass.", ["validator", "submodel"],
+    buckets=BATCH_BUCKETS,
+))
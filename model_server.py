@@ -0,0 +1,309 @@
+import asyncio
+import os
+import pickle
+import socket
+import struct
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from multiprocessing import resource_tracker, shared_memory
+from dotenv import load_dotenv
+from deadline import DeadlineExceeded, current_deadline
+from tracing import current_span
+
+load_dotenv()
+
+MODEL_SERVER_SOCKET = os.getenv("MODEL_SERVER_SOCKET", "/tmp/guardrails-models.sock")
+# Payloads above this size travel through shared memory instead of the socket.
+SHM_THRESHOLD = int(os.getenv("MODEL_SERVER_SHM_THRESHOLD", 64 * 1024))
+MAX_BATCH_SIZE = int(os.getenv("MODEL_SERVER_MAX_BATCH_SIZE", 32))
+BATCH_WINDOW_MS = float(os.getenv("MODEL_SERVER_BATCH_WINDOW_MS", 5))
+# Validators whose _inference_local maps a list of N inputs to a list of N outputs,
+# which lets the host merge requests from different workers into one forward pass.
+BATCHED_VALIDATORS = set(filter(None, os.getenv("MODEL_SERVER_BATCHED", "DetectJailbreak").split(",")))
+
+# How often a waiting client checks whether its request was cancelled.
+CANCEL_POLL_INTERVAL = 0.05
+
+HEADER = struct.Struct("!I")
+INLINE, SHARED = b"\x00", b"\x01"
+
+
+def pack(obj) -> bytes:
+    data = pickle.dumps(obj, protocol=pickle.HIGHEST_PROTOCOL)
+    if len(data) < SHM_THRESHOLD:
+        return INLINE + data
+
+    shm = shared_memory.SharedMemory(create=True, size=len(data))
+    shm.buf[:len(data)] = data
+    ref = pickle.dumps((shm.name, len(data)))
+    shm.close()
+    # Ownership moves to the reader, which unlinks the block once it has copied it.
+    resource_tracker.unregister(shm._name, "shared_memory")
+    return SHARED + ref
+
+def discard(frame: bytes):
+    """Frees the shared memory behind a frame that never reached its reader."""
+    if frame[:1] != SHARED:
+        return
+    name, _ = pickle.loads(frame[1:])
+    try:
+        shm = shared_memory.SharedMemory(name=name)
+    except FileNotFoundError:
+        return
+    shm.close()
+    shm.unlink()
+
+def unpack(frame: bytes):
+    if frame[:1] == INLINE:
+        return pickle.loads(frame[1:])
+
+    name, size = pickle.loads(frame[1:])
+    shm = shared_memory.SharedMemory(name=name)
+    try:
+        data = bytes(shm.buf[:size])
+    finally:
+        shm.close()
+        shm.unlink()
+    return pickle.loads(data)
+
+
+class ModelServerClient:
+    """Blocking client used by the FastAPI workers, one connection per thread."""
+
+    def __init__(self, path: str = MODEL_SERVER_SOCKET, timeout: float = 60.0):
+        self.path = path
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _connection(self) -> socket.socket:
+        sock = getattr(self._local, "sock", None)
+        if sock is None:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.settimeout(self.timeout)
+            sock.connect(self.path)
+            self._local.sock = sock
+        return sock
+
+    def _close(self):
+        sock = getattr(self._local, "sock", None)
+        if sock is not None:
+            sock.close()
+            self._local.sock = None
+
+    def _recv_exact(self, sock: socket.socket, size: int, deadline, started: float) -> bytes:
+        buf = bytearray()
+        while len(buf) < size:
+            try:
+                chunk = sock.recv(size - len(buf))
+            except socket.timeout:
+                # Waking up periodically lets a disconnect or deadline stop the wait.
+                if deadline.expired():
+                    raise DeadlineExceeded()
+                if time.monotonic() - started >= self.timeout:
+                    raise
+                continue
+            if not chunk:
+                raise ConnectionError("Model server closed the connection")
+            buf.extend(chunk)
+        return bytes(buf)
+
+    def _roundtrip(self, frame: bytes, deadline) -> dict:
+        try:
+            sock = self._connection()
+            sock.settimeout(self.timeout)
+            sock.sendall(HEADER.pack(len(frame)) + frame)
+        except BaseException:
+            discard(frame)
+            raise
+        started = time.monotonic()
+        sock.settimeout(CANCEL_POLL_INTERVAL)
+        (size,) = HEADER.unpack(self._recv_exact(sock, HEADER.size, deadline, started))
+        return unpack(self._recv_exact(sock, size, deadline, started))
+
+    def infer(self, validator_name: str, model_input):
+        deadline = current_deadline.get()
+        if deadline.expired():
+            raise DeadlineExceeded()
+        # The host drops requests whose deadline passed while they waited for a batch.
+        # A request cancelled early (e.g. the client disconnected) closes its connection
+        # instead, which the host takes as the signal to drop it.
+        request = {"validator": validator_name, "input": model_input, "deadline": deadline.wall_clock()}
+        try:
+            response = self._roundtrip(pack(request), deadline)
+        except (ConnectionError, BrokenPipeError, FileNotFoundError):
+            # The host may have restarted since this thread last connected.
+            self._close()
+            try:
+                response = self._roundtrip(pack(request), deadline)
+            except Exception:
+                self._close()
+                raise
+        except Exception:
+            self._close()
+            raise
+
+        if response.get("timed_out"):
+            raise DeadlineExceeded()
+        if "error" in response:
+            raise RuntimeError(f"Model server error for {validator_name}: {response['error']}")
+        # Inputs in the forward pass this request shared with other workers' requests.
+        current_span().set_attribute("model_server.batch_size", response["batch_size"])
+        return response["output"]
+
+
+def use_model_server(validator, validator_name: str, client: ModelServerClient):
+    """Routes the validator's remote inference path to the local model host."""
+    validator._inference_remote = partial(client.infer, validator_name)
+    return validator
+
+
+class ModelHost:
+    def __init__(self, validators: dict):
+        self.validators = validators
+        # One thread per validator: models are only ever driven by a single caller.
+        self.executors = {name: ThreadPoolExecutor(max_workers=1) for name in validators}
+        self.queues = {}
+
+    async def start_batchers(self):
+        for name in self.validators:
+            if name in BATCHED_VALIDATORS:
+                self.queues[name] = asyncio.Queue()
+                asyncio.create_task(self._batch_loop(name))
+
+    async def _run(self, name: str, model_input):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self.executors[name], self.validators[name]._inference_local, model_input
+        )
+
+    async def infer(self, name: str, model_input, deadline=None):
+        """Returns (output, number of inputs in the forward pass that produced it)."""
+        if name in self.queues and isinstance(model_input, list):
+            future = asyncio.get_running_loop().create_future()
+            await self.queues[name].put((model_input, future, deadline))
+            return await future
+        if deadline is not None and time.time() >= deadline:
+            raise DeadlineExceeded()
+        batch_size = len(model_input) if isinstance(model_input, list) else 1
+        return await self._run(name, model_input), batch_size
+
+    async def _batch_loop(self, name: str):
+        queue = self.queues[name]
+        loop = asyncio.get_running_loop()
+        while True:
+            items = [await queue.get()]
+            size = len(items[0][0])
+            window_end = loop.time() + BATCH_WINDOW_MS / 1000
+            while size < MAX_BATCH_SIZE:
+                timeout = window_end - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                items.append(item)
+                size += len(item[0])
+
+            # Drop items whose caller has given up before paying for the forward pass.
+            now = time.time()
+            for _, future, deadline in items:
+                if deadline is not None and now >= deadline and not future.done():
+                    future.set_exception(DeadlineExceeded())
+            items = [item for item in items if not item[1].done()]
+            if not items:
+                continue
+
+            merged = [x for model_input, _, _ in items for x in model_input]
+            try:
+                outputs = await self._run(name, merged)
+                if len(outputs) != len(merged):
+                    raise ValueError(f"{name} returned {len(outputs)} outputs for {len(merged)} inputs")
+            except Exception as e:
+                for _, future, _ in items:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            offset = 0
+            for model_input, future, _ in items:
+                if not future.done():
+                    future.set_result((outputs[offset:offset + len(model_input)], len(merged)))
+                offset += len(model_input)
+
+    async def _infer_until_closed(self, reader: asyncio.StreamReader, name: str, model_input, deadline):
+        """Runs infer, cancelling it if the worker closes the connection meanwhile. A
+        cancelled batch item is done, so the batcher drops it before the forward pass."""
+        infer = asyncio.ensure_future(self.infer(name, model_input, deadline))
+        # Workers send nothing while waiting for a response, so this only completes on close.
+        closed = asyncio.ensure_future(reader.read(1))
+        try:
+            await asyncio.wait({infer, closed}, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            closed.cancel()
+            # The reader only accepts the next read once the cancelled one has finished.
+            await asyncio.wait({closed})
+        if not infer.done():
+            infer.cancel()
+            raise ConnectionResetError("Worker closed the connection")
+        return infer.result()
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                try:
+                    (size,) = HEADER.unpack(await reader.readexactly(HEADER.size))
+                    request = unpack(await reader.readexactly(size))
+                except asyncio.IncompleteReadError:
+                    break
+
+                name = request.get("validator")
+                try:
+                    if name not in self.validators:
+                        raise KeyError(f"Unknown validator {name}")
+                    output, batch_size = await self._infer_until_closed(
+                        reader, name, request["input"], request.get("deadline")
+                    )
+                    response = {"output": output, "batch_size": batch_size}
+                except ConnectionResetError:
+                    break
+                except DeadlineExceeded:
+                    response = {"timed_out": True}
+                except Exception as e:
+                    response = {"error": repr(e)}
+
+                frame = pack(response)
+                try:
+                    writer.write(HEADER.pack(len(frame)) + frame)
+                    await writer.drain()
+                except (ConnectionError, OSError):
+                    # The worker is gone and will never unpack the response.
+                    discard(frame)
+                    break
+        finally:
+            writer.close()
+
+
+async def serve(path: str = MODEL_SERVER_SOCKET):
+    from config import get_validator, validator_factories
+
+    host = ModelHost({name: get_validator(name) for name in validator_factories})
+    await host.start_batchers()
+    if os.path.exists(path):
+        os.unlink(path)
+    server = await asyncio.start_unix_server(host.handle_connection, path=path)
+    os.chmod(path, 0o600)
+    print(f"Model server listening on {path}", flush=True)
+    async with server:
+        await server.serve_forever()
+
+
+if __name__ == "__main__":
+    # The host owns the models, so it always builds validators for local inference.
+    os.environ["MODEL_SERVER_ROLE"] = "host"
+    from runtime import configure_runtime
+    # The host is the node's only inference process.
+    configure_runtime(workers=1)
+    asyncio.run(serve())
@@ -4,6 +4,8 @@ from typing import Optional, Union
 from fastapi import File, UploadFile
 from pydantic import BaseModel, validator
 
+VALIDATION_POLICIES = ["full_report", "fail_fast"]
+
 class ValidationRequest(BaseModel):
     type: str
     userprompt: str
@@ -12,6 +14,7 @@ class ValidationRequest(BaseModel):
     attachments: Optional[UploadFile] = File(None)
     attachment_file_path: Optional[str] = None
     attachment_file_type: Optional[str] = None
+    attachment_callback_url: Optional[str] = None
 
     class Config:
         arbitrary_types_allowed = True
@@ -42,10 +45,47 @@ class ValidationRequest(BaseModel):
             raise ValueError(f"Invalid file type. Allowed types are: {allowed_types}")
         return attachment_file_type
 
+    @validator("attachment_callback_url")
+    def validate_callback_url(cls, attachment_callback_url):
+        if attachment_callback_url and not re.match(r"^https?://[^\s/]+", attachment_callback_url):
+            raise ValueError("attachment_callback_url must be an http(s) URL")
+        return attachment_callback_url
+
 class RegistrationRequest(BaseModel):
     input_validators: list[str]
     output_validators: list[str]
     selected_model: str
+    validation_policy: str = "full_report"
+
+    @validator("validation_policy")
+    def validate_policy(cls, value):
+        if value not in VALIDATION_POLICIES:
+            raise ValueError(f"Invalid validation policy. Allowed policies are: {VALIDATION_POLICIES}")
+        return value
+
+class BulkRegistrationRequest(BaseModel):
+    keys: list[RegistrationRequest]
+
+    @validator("keys")
+    def validate_keys(cls, keys):
+        if not keys:
+            raise ValueError("keys must not be empty")
+        max_keys = int(os.getenv("BULK_REGISTER_MAX_KEYS", 100))
+        if len(keys) > max_keys:
+            raise ValueError(f"At most {max_keys} keys can be created at once")
+        return keys
+
+class KeyUpdateRequest(BaseModel):
+    input_validators: Optional[list[str]] = None
+    output_validators: Optional[list[str]] = None
+    selected_model: Optional[str] = None
+    validation_policy: Optional[str] = None
+
+    @validator("validation_policy")
+    def validate_policy(cls, value):
+        if value is not None and value not in VALIDATION_POLICIES:
+            raise ValueError(f"Invalid validation policy. Allowed policies are: {VALIDATION_POLICIES}")
+        return value
 
 class KeyDeletionRequest(BaseModel):
     key_id: str
@@ -1,3 +1,12 @@
-from .main import DetectJailbreak
+from .tokenization import STATS as TOKENIZATION_STATS, add_forward_observer, tokenization_scope
 
-__all__ = ["DetectJailbreak"]
+__all__ = ["DetectJailbreak", "TOKENIZATION_STATS", "add_forward_observer", "tokenization_scope"]
+
+
+def __getattr__(name):
+    # The validator pulls in torch and transformers, so it is only imported on first use;
+    # the tokenization hooks above are plain Python.
+    if name == "DetectJailbreak":
+        from .main import DetectJailbreak
+        return DetectJailbreak
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
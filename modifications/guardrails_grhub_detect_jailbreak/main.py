@@ -1,10 +1,15 @@
 import json
+import logging
 import math
+import os
 from typing import Callable, List, Optional, Union, Any
 
 import torch
 from torch.nn import functional as F
-from transformers import pipeline, AutoTokenizer, AutoModel
+from safetensors.torch import load_file, save_file
+from transformers import (
+    pipeline, AutoTokenizer, AutoModel, AutoModelForSequenceClassification
+)
 
 from guardrails.validator_base import (
     FailResult,
@@ -13,9 +18,20 @@ from guardrails.validator_base import (
     Validator,
     register_validator,
 )
-from .resources import KNOWN_ATTACKS, get_tokenizer_and_model_by_path, get_pipeline_by_path
-from .models import PromptSaturationDetectorV3
+from .resources import (
+    KNOWN_ATTACKS,
+    SNAPSHOT_KNOWN_ATTACKS,
+    SNAPSHOT_MANIFEST,
+    get_pipeline_by_path,
+    get_tokenizer_and_model_by_path,
+    get_tokenizer_and_model_from_snapshot,
+    is_snapshot,
+    known_attacks_digest,
+)
+from .models import PromptSaturationDetectorV3, classify_sequences
+from .tokenization import encode, timed_forward
 
+logger = logging.getLogger(__name__)
 
 @register_validator(name="guardrails/detect_jailbreak", data_type="string")
 class DetectJailbreak(Validator):
@@ -42,6 +58,16 @@ class DetectJailbreak(Validator):
         on supported hardware. A device ID can also be specified, e.g., "cuda:0".
         
         model_path_override (str): A pointer to an ensemble tar file in S3 or on disk.
+
+        snapshot_path (str): A directory written by `save_snapshot`. When it holds a
+        snapshot, the sub-models and the known-attack embeddings are loaded from it
+        instead of the hub or `model_path_override`.
+
+        cascade (bool): Defaults to False. Runs the sub-models cheapest first (known
+        attack match, saturation, text classifier) and stops scoring a prompt once one
+        sub-score exceeds the threshold. Verdicts are unchanged, but the score of a
+        failing prompt is the highest sub-score seen before it stopped rather than the
+        maximum over all three.
     """  # noqa
 
     TEXT_CLASSIFIER_NAME = "zhx123/ftrobertallm"
@@ -66,12 +92,14 @@ class DetectJailbreak(Validator):
             device: str = "cpu",
             on_fail: Optional[Callable] = None,
             model_path_override: str = "",
+            snapshot_path: str = "",
+            cascade: bool = False,
             **kwargs,
     ):
-        print("INIINT2", flush=True)
         super().__init__(on_fail=on_fail, **kwargs)
         self.device = device
         self.threshold = threshold
+        self.cascade = cascade
         self.saturation_attack_detector = None
         self.text_classifier = None
         self.embedding_tokenizer = None
@@ -88,7 +116,9 @@ class DetectJailbreak(Validator):
             self.use_local = True
 
         if self.use_local:
-            if not model_path_override:
+            if is_snapshot(snapshot_path):
+                self._load_snapshot(snapshot_path)
+            elif not model_path_override:
                 self.saturation_attack_detector = PromptSaturationDetectorV3(
                     device=torch.device(device),
                 )
@@ -99,7 +129,6 @@ class DetectJailbreak(Validator):
                     truncation=True,
                     device=device,
                 )
-                print(self.text_classifier, flush=True)
                 # There are a large number of fairly low-effort prompts people will use.
                 # The embedding detectors do checks to roughly match those.
                 self.embedding_tokenizer = AutoTokenizer.from_pretrained(
@@ -133,14 +162,72 @@ class DetectJailbreak(Validator):
                     device=device
                 )
 
-            # Quick compute on startup:
-            self.known_malicious_embeddings = self._embed(KNOWN_ATTACKS)
+            if not len(self.known_malicious_embeddings):
+                # Quick compute on startup:
+                self.known_malicious_embeddings = self._embed(KNOWN_ATTACKS)
 
         # These _are_ modifyable, but not explicitly advertised.
         self.known_attack_scales = DetectJailbreak.DEFAULT_KNOWN_ATTACK_SCALE_FACTORS
         self.saturation_attack_scales = DetectJailbreak.DEFAULT_SATURATION_ATTACK_SCALE_FACTORS
         self.text_attack_scales = DetectJailbreak.DEFAULT_TEXT_CLASSIFIER_SCALE_FACTORS
 
+    def _load_snapshot(self, path: str):
+        self.saturation_attack_detector = PromptSaturationDetectorV3(
+            device=torch.device(self.device),
+            snapshot_path=path,
+        )
+        embedding_tokenizer, embedding_model = get_tokenizer_and_model_from_snapshot(
+            path, "embedding", AutoTokenizer, AutoModel
+        )
+        self.embedding_tokenizer = embedding_tokenizer
+        self.embedding_model = embedding_model.to(self.device)
+        text_tokenizer, text_model = get_tokenizer_and_model_from_snapshot(
+            path, "text-classifier", AutoTokenizer, AutoModelForSequenceClassification
+        )
+        self.text_classifier = pipeline(
+            "text-classification",
+            model=text_model,
+            tokenizer=text_tokenizer,
+            max_length=512,
+            truncation=True,
+            device=self.device,
+        )
+
+        with open(os.path.join(path, SNAPSHOT_MANIFEST)) as f:
+            manifest = json.load(f)
+        # Embeddings computed for a different attack list would silently be wrong.
+        if manifest.get("known_attacks_sha256") == known_attacks_digest():
+            self.known_malicious_embeddings = load_file(
+                os.path.join(path, SNAPSHOT_KNOWN_ATTACKS)
+            )["embeddings"].to(self.device)
+
+    def save_snapshot(self, path: str):
+        """Writes the sub-models as safetensors, plus the known-attack embeddings, so
+        that a later DetectJailbreak(snapshot_path=path) starts without hub lookups,
+        checkpoint unpickling or re-embedding KNOWN_ATTACKS."""
+        submodels = [
+            ("prompt-saturation-attack", self.saturation_attack_detector.model,
+             self.saturation_attack_detector.tokenizer),
+            ("text-classifier", self.text_classifier.model, self.text_classifier.tokenizer),
+            ("embedding", self.embedding_model, self.embedding_tokenizer),
+        ]
+        os.makedirs(path, exist_ok=True)
+        for name, model, tokenizer in submodels:
+            model.save_pretrained(os.path.join(path, f"{name}-model"), safe_serialization=True)
+            tokenizer.save_pretrained(os.path.join(path, f"{name}-tokenizer"))
+        save_file(
+            {"embeddings": self.known_malicious_embeddings.detach().cpu().contiguous()},
+            os.path.join(path, SNAPSHOT_KNOWN_ATTACKS),
+        )
+        # The manifest goes last: its presence marks the snapshot as complete.
+        with open(os.path.join(path, SNAPSHOT_MANIFEST), "w") as f:
+            json.dump({
+                "version": 1,
+                "text_classifier": DetectJailbreak.TEXT_CLASSIFIER_NAME,
+                "embedding_model": DetectJailbreak.EMBEDDING_MODEL_NAME,
+                "known_attacks_sha256": known_attacks_digest(),
+            }, f, indent=2)
+
     @staticmethod
     def _rescale(x: float, a: float = 1.0, b: float = 1.0):
         return 1.0 / (1.0 + (a*math.exp(-b*x)))
@@ -164,14 +251,12 @@ class DetectJailbreak(Validator):
         We use the long-form to avoid a dependency on sentence transformers.
         This method returns the maximum of the matches against all known attacks.
         """
-        encoded_input = self.embedding_tokenizer(
+        encoded_input = encode(
+            self.embedding_tokenizer,
             prompts,
-            padding=True,
-            truncation=True,
-            return_tensors='pt',
             max_length=512,  # This may be too small to adequately capture the info.
         ).to(self.device)
-        with torch.no_grad():
+        with timed_forward("embedding", len(prompts)), torch.no_grad():
             model_outputs = self.embedding_model(**encoded_input)
         embeddings = DetectJailbreak._mean_pool(
             model_outputs, attention_mask=encoded_input['attention_mask'])
@@ -218,11 +303,20 @@ class DetectJailbreak(Validator):
             scores.append(new_score)
         return scores
 
+    def _classify_text(self, prompts: List[str]) -> List[dict]:
+        # Same as calling the pipeline, but with tokenization and forward pass timed apart.
+        return classify_sequences(
+            self.text_classifier.tokenizer,
+            self.text_classifier.model,
+            prompts,
+            submodel="text_classifier",
+        )
+
     def _predict_jailbreak(self, prompts: List[str]) -> List[float]:
         return [
             DetectJailbreak._rescale(s, *self.text_attack_scales)
             for s in self._predict_and_remap(
-                self.text_classifier,
+                self._classify_text,
                 prompts,
                 "label",
                 "score",
@@ -247,6 +341,27 @@ class DetectJailbreak(Validator):
             )
         ]
 
+    def _predict_cascade(self, prompts: List[str]) -> List[float]:
+        scores = [0.0] * len(prompts)
+        pending = list(range(len(prompts)))
+        for stage in (
+                self._match_known_malicious_prompts,
+                self._predict_saturation,
+                self._predict_jailbreak,
+        ):
+            stage_scores = stage([prompts[i] for i in pending])
+            for i, score in zip(pending, stage_scores):
+                scores[i] = max(scores[i], score)
+            # Prompts over the threshold already fail; later stages can't change that.
+            pending = [i for i in pending if scores[i] <= self.threshold]
+            logger.debug(
+                "jailbreak cascade stage",
+                extra={"stage": stage.__name__, "scored": len(stage_scores), "remaining": len(pending)},
+            )
+            if not pending:
+                break
+        return scores
+
     def predict_jailbreak(
             self,
             prompts: List[str],
@@ -256,13 +371,22 @@ class DetectJailbreak(Validator):
         If reduction_function is set to 'none' it will return a dict with the different
         sub-validators and their scores. Useful for debugging and tuning."""
         if isinstance(prompts, str):
-            print("WARN: predict_jailbreak should be called with a list of strings.")
+            logger.warning("predict_jailbreak should be called with a list of strings.")
             prompts = [prompts, ]
+        # Early exit only preserves the verdict when the scores are reduced with max.
+        if self.cascade and reduction_function is max:
+            return self._predict_cascade(prompts)
         known_attack_scores = self._match_known_malicious_prompts(prompts)
         saturation_scores = self._predict_saturation(prompts)
-        print(saturation_scores, flush=True)
         predicted_scores = self._predict_jailbreak(prompts)
-        print(predicted_scores, flush=True)
+        logger.debug(
+            "jailbreak sub-scores",
+            extra={
+                "known_attack_scores": known_attack_scores,
+                "saturation_scores": saturation_scores,
+                "predicted_scores": predicted_scores,
+            },
+        )
         if reduction_function is None:
             return [{
                 "known_attack": known,
@@ -288,7 +412,6 @@ class DetectJailbreak(Validator):
         on the maximum injection likelihood.  A single validation result will be
         returned for all.
         """
-        print("CALLED", flush=True)
         if metadata:
             pass  # Log that this model supports no metadata?
 
@@ -321,12 +444,10 @@ class DetectJailbreak(Validator):
     # strange properties,
 
     def _inference_local(self, model_input: List[str]) -> Any:
-        print("HELLO WORLD", flush=True)
         return self.predict_jailbreak(model_input)
 
     def _inference_remote(self, model_input: List[str]) -> Any:
         # This needs to be kept in-sync with app_inference_spec.
-        print("REMOTE_CALLING", flush=True)
         request_body = {"prompts": model_input}
         response = self._hub_inference_request(
             json.dumps(request_body),
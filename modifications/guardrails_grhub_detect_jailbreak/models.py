@@ -1,10 +1,14 @@
+import logging
 from typing import List, Tuple, Optional, Union
 
 import numpy
 import torch
 import torch.nn as nn
 
-from .resources import get_tokenizer_and_model_by_path
+from .resources import get_tokenizer_and_model_by_path, get_tokenizer_and_model_from_snapshot
+from .tokenization import encode, timed_forward
+
+logger = logging.getLogger(__name__)
 
 
 def string_to_one_hot_tensor(
@@ -42,6 +46,31 @@ def string_to_one_hot_tensor(
     return out
 
 
+def classify_sequences(
+        tokenizer,
+        model,
+        text: Union[str, List[str]],
+        max_length: int = 512,
+        submodel: str = "",
+) -> List[dict]:
+    """Equivalent of a text-classification pipeline call, with the tokenization and
+    the forward pass timed separately."""
+    if isinstance(text, str):
+        text = [text, ]
+    encoded = encode(tokenizer, text, max_length=max_length).to(model.device)
+    with timed_forward(submodel, len(text)), torch.no_grad():
+        logits = model(**encoded).logits
+    if model.config.num_labels == 1:
+        probabilities = torch.sigmoid(logits)
+    else:
+        probabilities = torch.softmax(logits, dim=-1)
+    scores, labels = torch.max(probabilities, dim=-1)
+    return [
+        {"label": model.config.id2label[label], "score": score}
+        for label, score in zip(labels.tolist(), scores.tolist())
+    ]
+
+
 class PromptSaturationDetectorV0(nn.Module):
     def __init__(self):
         super().__init__()
@@ -171,12 +200,20 @@ class PromptSaturationDetectorV3:  # Note: Not nn.Module.
     def __init__(
             self,
             device: torch.device = torch.device('cpu'),
-            model_path_override: str = ""
+            model_path_override: str = "",
+            snapshot_path: str = "",
     ):
         from transformers import (
             pipeline, AutoTokenizer, AutoModelForSequenceClassification
         )
-        if not model_path_override:
+        if snapshot_path:
+            self.tokenizer, self.model = get_tokenizer_and_model_from_snapshot(
+                snapshot_path,
+                "prompt-saturation-attack",
+                AutoTokenizer,
+                AutoModelForSequenceClassification
+            )
+        elif not model_path_override:
             self.model = AutoModelForSequenceClassification.from_pretrained(
                 "GuardrailsAI/prompt-saturation-attack-detector",
             )
@@ -210,6 +247,6 @@ class PromptSaturationDetectorV3:  # Note: Not nn.Module.
         )
 
     def __call__(self, text: Union[str, List[str]]) -> List[dict]:
-        s = self.pipe(text)
-        print(s)
+        s = classify_sequences(self.tokenizer, self.pipe.model, text, submodel="saturation")
+        logger.debug("saturation predictions", extra={"predictions": s})
         return s
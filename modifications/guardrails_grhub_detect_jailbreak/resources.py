@@ -1,8 +1,11 @@
+import hashlib
 import os
 from pathlib import Path
 
 from cached_path import cached_path
-from transformers import pipeline
+from safetensors.torch import load_file
+from transformers import AutoConfig, pipeline
+from transformers.modeling_utils import no_init_weights
 
 
 MODEL_CACHE_DIR = os.environ.get(
@@ -80,3 +83,33 @@ def get_pipeline_by_path(path, submodel_name: str, task: str, **pipe_kwargs):
     )
 
 
+SNAPSHOT_MANIFEST = "manifest.json"
+SNAPSHOT_KNOWN_ATTACKS = "known-attacks.safetensors"
+
+
+def known_attacks_digest() -> str:
+    """Identifies the KNOWN_ATTACKS list a snapshot's precomputed embeddings belong to."""
+    return hashlib.sha256("\0".join(KNOWN_ATTACKS).encode()).hexdigest()
+
+
+def is_snapshot(path) -> bool:
+    return bool(path) and os.path.isfile(os.path.join(path, SNAPSHOT_MANIFEST))
+
+
+def get_tokenizer_and_model_from_snapshot(path, submodel_name, tokenizer_class, model_class):
+    """Loads a sub-model written by DetectJailbreak.save_snapshot without resolving
+    anything against the hub. from_pretrained would copy the weights into freshly
+    allocated parameters; here the parameters are the tensors of the memory-mapped
+    safetensors file itself, so every worker on a node reads the same pages."""
+    model_path = os.path.join(path, f"{submodel_name}-model")
+    with no_init_weights():
+        model = model_class.from_config(AutoConfig.from_pretrained(model_path, local_files_only=True))
+    # save_pretrained leaves tied weights out of the file; tie_weights() restores them.
+    model.load_state_dict(load_file(os.path.join(model_path, "model.safetensors")), strict=False, assign=True)
+    model.tie_weights()
+    model.eval()
+    tokenizer = tokenizer_class.from_pretrained(
+        os.path.join(path, f"{submodel_name}-tokenizer"),
+        local_files_only=True,
+    )
+    return tokenizer, model
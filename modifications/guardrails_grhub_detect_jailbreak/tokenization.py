@@ -0,0 +1,92 @@
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, List, Optional
+
+
+class TokenizationStats:
+    """Process-wide counters splitting time between tokenization and forward passes."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.tokenize_seconds = 0.0
+        self.forward_seconds = 0.0
+        self.tokenize_calls = 0
+        self.forward_calls = 0
+
+    def add_tokenize(self, seconds: float):
+        with self._lock:
+            self.tokenize_seconds += seconds
+            self.tokenize_calls += 1
+
+    def add_forward(self, seconds: float):
+        with self._lock:
+            self.forward_seconds += seconds
+            self.forward_calls += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "tokenize_seconds": self.tokenize_seconds,
+                "forward_seconds": self.forward_seconds,
+                "tokenize_calls": self.tokenize_calls,
+                "forward_calls": self.forward_calls,
+            }
+
+
+STATS = TokenizationStats()
+# The same split for the validators run inside one tokenization_scope().
+_current_stats: ContextVar[Optional[TokenizationStats]] = ContextVar(
+    "tokenization_stats", default=None
+)
+
+
+@contextmanager
+def tokenization_scope():
+    """Collects the tokenization and forward time of every validator run inside the
+    block, e.g. one request, into the TokenizationStats it yields."""
+    stats = TokenizationStats()
+    token = _current_stats.set(stats)
+    try:
+        yield stats
+    finally:
+        _current_stats.reset(token)
+
+
+def encode(tokenizer, texts: List[str], max_length: int = 512):
+    """Tokenizes and pads a batch in a single call, which is the fast path of HF fast
+    tokenizers, and records the time it took."""
+    start = time.perf_counter()
+    encoded = tokenizer(
+        texts, padding=True, truncation=True, max_length=max_length, return_tensors="pt"
+    )
+    elapsed = time.perf_counter() - start
+    STATS.add_tokenize(elapsed)
+    scope = _current_stats.get()
+    if scope is not None:
+        scope.add_tokenize(elapsed)
+    return encoded
+
+
+_forward_observers: List[Callable[[str, float, int], None]] = []
+
+
+def add_forward_observer(observer: Callable[[str, float, int], None]):
+    """observer(submodel, seconds, batch_size) is called after every timed forward pass."""
+    _forward_observers.append(observer)
+
+
+@contextmanager
+def timed_forward(submodel: str = "", batch_size: int = 0):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        STATS.add_forward(elapsed)
+        scope = _current_stats.get()
+        if scope is not None:
+            scope.add_forward(elapsed)
+        for observer in _forward_observers:
+            observer(submodel, elapsed, batch_size)
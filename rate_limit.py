@@ -0,0 +1,158 @@
+import asyncio
+import logging
+import math
+import os
+import time
+from collections import defaultdict
+from dotenv import load_dotenv
+from fastapi import HTTPException, Request
+import redis.asyncio as redis
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost")
+REDIS_MAX_CONNECTIONS = int(os.getenv("REDIS_MAX_CONNECTIONS", 10))
+RATE_LIMIT_SYNC_INTERVAL_MS = float(os.getenv("RATE_LIMIT_SYNC_INTERVAL_MS", 500))
+REDIS_KEY_PREFIX = "ratelimit"
+
+
+class TokenBucket:
+    def __init__(self, capacity, refill_per_second):
+        self.capacity = capacity
+        self.refill_per_second = refill_per_second
+        self.tokens = float(capacity)
+        self.updated_at = time.monotonic()
+
+    def take(self):
+        """Returns 0 if a token was taken, otherwise the seconds until one is available."""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.refill_per_second)
+        self.updated_at = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.refill_per_second
+
+    def is_full(self):
+        elapsed = time.monotonic() - self.updated_at
+        return self.tokens + elapsed * self.refill_per_second >= self.capacity
+
+
+class HybridRateLimiter:
+    """Enforces per-key token buckets in process memory and periodically pushes the
+    consumed counts to Redis as batched INCRBYs on fixed windows shared by all
+    workers. Once a window's global count reaches the limit the key is blocked
+    locally until the window ends. If Redis is unreachable the local buckets keep
+    enforcing limits on their own."""
+
+    def __init__(self, sync_interval):
+        self.sync_interval = sync_interval
+        self.redis = None
+        self.buckets = {}
+        self.rules = {}
+        self.pending = defaultdict(int)
+        self.blocked_until = {}
+        self.redis_down = False
+        self._task = None
+
+    def hit(self, key, times, seconds):
+        now = time.time()
+        blocked_until = self.blocked_until.get(key)
+        if blocked_until:
+            if blocked_until > now:
+                return blocked_until - now
+            del self.blocked_until[key]
+
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            bucket = self.buckets[key] = TokenBucket(times, times / seconds)
+            self.rules[key] = (times, seconds)
+        retry_after = bucket.take()
+        if not retry_after:
+            self.pending[key] += 1
+        return retry_after
+
+    async def start(self, redis_client=None):
+        if redis_client is None:
+            pool = redis.ConnectionPool.from_url(
+                REDIS_URL, max_connections=REDIS_MAX_CONNECTIONS, encoding="utf-8", decode_responses=True
+            )
+            redis_client = redis.Redis(connection_pool=pool)
+        self.redis = redis_client
+        self._task = asyncio.create_task(self._sync_loop())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+        await self.sync()
+        if self.redis is not None:
+            await self.redis.close()
+
+    async def _sync_loop(self):
+        while True:
+            await asyncio.sleep(self.sync_interval)
+            await self.sync()
+
+    async def sync(self):
+        pending, self.pending = self.pending, defaultdict(int)
+        if pending and self.redis is not None:
+            now = time.time()
+            windows = []
+            try:
+                pipe = self.redis.pipeline(transaction=False)
+                for key, count in pending.items():
+                    times, seconds = self.rules[key]
+                    window_end = (math.floor(now / seconds) + 1) * seconds
+                    redis_key = f"{REDIS_KEY_PREFIX}:{key}:{int(window_end)}"
+                    pipe.incrby(redis_key, count)
+                    pipe.pexpireat(redis_key, int(window_end * 1000) + 1000)
+                    windows.append((key, times, window_end))
+                results = await pipe.execute()
+            except Exception as e:
+                # Local buckets keep limiting; these counts are dropped rather than
+                # replayed later, which could block keys for a whole window.
+                if not self.redis_down:
+                    # Once per outage; this runs every sync interval until Redis is back.
+                    logger.warning("Rate limiter could not sync with Redis, limiting per worker until it recovers: %r", e)
+                    self.redis_down = True
+            else:
+                if self.redis_down:
+                    logger.warning("Rate limiter is syncing with Redis again")
+                    self.redis_down = False
+                for (key, times, window_end), global_count in zip(windows, results[::2]):
+                    if global_count >= times:
+                        self.blocked_until[key] = window_end
+
+        # Forget keys that have been idle long enough to refill completely.
+        for key in [key for key, bucket in self.buckets.items() if bucket.is_full() and key not in self.pending]:
+            del self.buckets[key]
+            del self.rules[key]
+
+
+limiter = HybridRateLimiter(RATE_LIMIT_SYNC_INTERVAL_MS / 1000)
+
+
+def _identifier(request: Request):
+    forwarded = request.headers.get("X-Forwarded-For")
+    ip = forwarded.split(",")[0] if forwarded else request.client.host
+    return f"{ip}:{request.scope['path']}"
+
+
+class RateLimiter:
+    """Route dependency, a drop-in for fastapi_limiter's RateLimiter."""
+
+    def __init__(self, times: int = 1, seconds: int = 0, minutes: int = 0, hours: int = 0):
+        self.times = times
+        self.seconds = seconds + 60 * minutes + 3600 * hours
+
+    async def __call__(self, request: Request):
+        retry_after = limiter.hit(_identifier(request), self.times, self.seconds)
+        if retry_after:
+            raise HTTPException(
+                status_code=429,
+                detail="Too Many Requests",
+                headers={"Retry-After": str(max(1, math.ceil(retry_after)))},
+            )
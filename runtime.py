@@ -0,0 +1,118 @@
+import fcntl
+import logging
+import math
+import os
+import tempfile
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Workers sharing the node. uvicorn reads the same variable as its --workers default, but
+# only from the environment, not from .env, so pass a matching --workers.
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", 1))
+# Unset or empty means an even share of the usable cores per worker.
+TORCH_INTRA_OP_THREADS = int(os.getenv("TORCH_INTRA_OP_THREADS") or 0)
+TORCH_INTER_OP_THREADS = int(os.getenv("TORCH_INTER_OP_THREADS", 1))
+CPU_AFFINITY_PINNING = os.getenv("CPU_AFFINITY_PINNING", "false").lower() == "true"
+RUNTIME_LOCK_DIR = os.getenv("RUNTIME_LOCK_DIR", tempfile.gettempdir())
+
+_runtime = None
+_slot_lock = None
+
+
+def affinity_cpus():
+    try:
+        return sorted(os.sched_getaffinity(0))
+    except AttributeError:  # Not available on macOS.
+        return list(range(os.cpu_count() or 1))
+
+
+def cgroup_cpu_limit():
+    """CPUs allowed by the container's CFS quota, or None when unlimited."""
+    try:
+        # cgroup v2: "<quota> <period>" or "max <period>"
+        with open("/sys/fs/cgroup/cpu.max") as f:
+            quota, period = f.read().split()
+        if quota != "max":
+            return int(quota) / int(period)
+        return None
+    except (OSError, ValueError):
+        pass
+    try:
+        with open("/sys/fs/cgroup/cpu/cpu.cfs_quota_us") as f:
+            quota = int(f.read())
+        with open("/sys/fs/cgroup/cpu/cpu.cfs_period_us") as f:
+            period = int(f.read())
+        return quota / period if quota > 0 else None
+    except (OSError, ValueError):
+        return None
+
+
+def available_cpus():
+    cpus = len(affinity_cpus())
+    limit = cgroup_cpu_limit()
+    return max(1, min(cpus, math.floor(limit))) if limit else cpus
+
+
+def _claim_slot(slots):
+    """Takes the first free slot by locking its file; the lock is released when the process exits."""
+    global _slot_lock
+    os.makedirs(RUNTIME_LOCK_DIR, exist_ok=True)
+    for slot in range(slots):
+        lock = open(os.path.join(RUNTIME_LOCK_DIR, f"guardrails-cpu-slot-{slot}.lock"), "w")
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock.close()
+            continue
+        _slot_lock = lock
+        return slot
+    return None
+
+
+def configure_runtime(workers=None, threads=None, pin=None):
+    """Sizes torch's thread pools for this process's share of the node, and optionally
+    pins it to its own cores. Only the first call in a process takes effect.
+    Returns the applied settings."""
+    global _runtime
+    if _runtime is not None:
+        return _runtime
+    try:
+        import torch
+    except ImportError:
+        torch = None  # Stub validators only; there are no torch pools to size.
+
+    workers = max(1, workers or WEB_CONCURRENCY)
+    pin = CPU_AFFINITY_PINNING if pin is None else pin
+    cpus = available_cpus()
+    threads = threads or TORCH_INTRA_OP_THREADS or max(1, cpus // workers)
+
+    pinned_cpus = None
+    if pin:
+        slot = _claim_slot(max(1, len(affinity_cpus()) // threads))
+        if slot is None:
+            logger.warning("No free CPU slot to pin to, leaving affinity unchanged")
+        else:
+            pinned_cpus = affinity_cpus()[slot * threads:(slot + 1) * threads]
+            os.sched_setaffinity(0, pinned_cpus)
+
+    if torch is not None:
+        torch.set_num_threads(threads)
+        try:
+            torch.set_num_interop_threads(TORCH_INTER_OP_THREADS)
+        except RuntimeError:
+            pass  # Only settable before the first inter-op parallel work.
+    # Each worker's torch threads already cover its cores; the Rust tokenizer pool would oversubscribe them.
+    os.environ["TOKENIZERS_PARALLELISM"] = "true" if workers == 1 and threads == cpus else "false"
+
+    _runtime = {
+        "available_cpus": cpus,
+        "workers": workers,
+        "intra_op_threads": threads,
+        "inter_op_threads": torch.get_num_interop_threads() if torch is not None else None,
+        "pinned_cpus": pinned_cpus,
+    }
+    logger.info("Configured runtime", extra=_runtime)
+    return _runtime
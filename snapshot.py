@@ -0,0 +1,34 @@
+"""Writes a warm-start snapshot of the DetectJailbreak models to MODEL_SNAPSHOT_DIR.
+
+Workers (and model_server.py) started with MODEL_SNAPSHOT_DIR set load the
+safetensors weights and the precomputed known-attack embeddings from it, instead
+of resolving checkpoints against the hub and re-embedding KNOWN_ATTACKS.
+
+    python snapshot.py
+    python snapshot.py --output /var/lib/guardrails/snapshot
+"""
+import argparse
+import os
+import time
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--output", default=os.getenv("MODEL_SNAPSHOT_DIR"))
+    args = parser.parse_args()
+    if not args.output:
+        parser.error("set MODEL_SNAPSHOT_DIR or pass --output")
+
+    from guardrails.hub import DetectJailbreak
+
+    start = time.perf_counter()
+    validator = DetectJailbreak(on_fail="noop", use_local=True)
+    print(f"Loaded DetectJailbreak in {time.perf_counter() - start:.1f}s")
+    validator.save_snapshot(args.output)
+
+    start = time.perf_counter()
+    DetectJailbreak(on_fail="noop", use_local=True, snapshot_path=args.output)
+    print(f"Snapshot written to {args.output}, reloads in {time.perf_counter() - start:.1f}s")
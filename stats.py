@@ -0,0 +1,97 @@
+from datetime import datetime, timedelta, timezone
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from database import ValidationStat, engine
+
+STAT_COLUMNS = {"pass": "passed", "fail": "failed", "skipped": "skipped", "timed_out": "timed_out"}
+# Which status wins when several runs of a validator are combined into one.
+STATUS_PRECEDENCE = ["fail", "timed_out", "pass", "skipped"]
+MAX_STATS_RANGE = timedelta(days=90)
+
+
+def hour_bucket(at=None):
+    return (at or datetime.now(timezone.utc)).replace(minute=0, second=0, microsecond=0)
+
+
+def as_utc(at):
+    return at.replace(tzinfo=timezone.utc) if at.tzinfo is None else at.astimezone(timezone.utc)
+
+
+def combine_statuses(runs):
+    """Merges several {validator: (status, seconds)} into one, e.g. the chunks of an
+    attachment, so that they count as a single validation: a validator fails if any
+    run failed, and its latency is the sum of its runs."""
+    combined = {}
+    for statuses in runs:
+        for name, (status, seconds) in statuses.items():
+            previous_status, previous_seconds = combined.get(name, ("skipped", None))
+            if STATUS_PRECEDENCE.index(status) < STATUS_PRECEDENCE.index(previous_status):
+                previous_status = status
+            if seconds is not None:
+                previous_seconds = (previous_seconds or 0.0) + seconds
+            combined[name] = (previous_status, previous_seconds)
+    # Latency only averages over passed and failed runs, see validation_stats.
+    return {
+        name: (status, seconds if status in ("pass", "fail") else None)
+        for name, (status, seconds) in combined.items()
+    }
+
+
+def record_validation_stats(db, api_id, statuses, at=None):
+    """Adds one request's {validator: (status, seconds)} to the current hour's rollup rows.
+    Runs in the caller's transaction, so the rollup commits together with the results.
+    The increments happen in the upsert itself, so concurrent workers don't lose counts."""
+    if not statuses:
+        return
+    hour = hour_bucket(at)
+    rows = [
+        {
+            "api_id": api_id,
+            "hour": hour,
+            "validator_name": name,
+            "passed": 0, "failed": 0, "skipped": 0, "timed_out": 0,
+            STAT_COLUMNS[status]: 1,
+            "latency_ms_sum": (seconds or 0.0) * 1000,
+        }
+        for name, (status, seconds) in sorted(statuses.items())
+    ]
+    insert = postgresql_insert if engine.dialect.name == "postgresql" else sqlite_insert
+    statement = insert(ValidationStat).values(rows)
+    statement = statement.on_conflict_do_update(
+        index_elements=["api_id", "hour", "validator_name"],
+        set_={
+            column: getattr(ValidationStat, column) + getattr(statement.excluded, column)
+            for column in [*STAT_COLUMNS.values(), "latency_ms_sum"]
+        },
+    )
+    db.execute(statement)
+
+
+def validation_stats(db, api_id, start=None, end=None):
+    end = as_utc(end) if end else datetime.now(timezone.utc)
+    start = as_utc(start) if start else end - timedelta(days=1)
+    if end - start > MAX_STATS_RANGE:
+        raise ValueError(f"The stats range can span at most {MAX_STATS_RANGE.days} days")
+    rows = (
+        db.query(ValidationStat)
+        .filter(
+            ValidationStat.api_id == api_id,
+            ValidationStat.hour >= hour_bucket(start),
+            ValidationStat.hour < end,
+        )
+        .order_by(ValidationStat.hour, ValidationStat.validator_name)
+        .all()
+    )
+    return [
+        {
+            "hour": as_utc(row.hour).isoformat(),
+            "validator_name": row.validator_name,
+            "passed": row.passed,
+            "failed": row.failed,
+            "skipped": row.skipped,
+            "timed_out": row.timed_out,
+            "failure_rate": row.failed / (row.passed + row.failed) if row.passed + row.failed else 0.0,
+            "avg_latency_ms": row.latency_ms_sum / (row.passed + row.failed) if row.passed + row.failed else None,
+        }
+        for row in rows
+    ]
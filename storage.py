@@ -0,0 +1,152 @@
+"""Compact storage format for the entries of events.results.
+
+Compared to what /validate used to store, an entry
+  - omits validation_outcome.raw_llm_output when it is just the validated prompts,
+  - references its system prompt by sha256 in the system_prompts table,
+  - keeps a long userprompt zstd-compressed (base64), optionally with a trained dictionary.
+expand_result restores the original shape; entries written before this format pass through.
+
+    python storage.py train-dictionary --samples 10000
+"""
+import argparse
+import base64
+import hashlib
+import os
+import threading
+import zstandard
+from dotenv import load_dotenv
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from cache import TTLCache
+from database import Event, SessionLocal, SystemPrompt, ZstdDictionary, engine
+
+load_dotenv()
+
+STORAGE_FORMAT = 2
+STORAGE_COMPRESS_MIN_BYTES = int(os.getenv("STORAGE_COMPRESS_MIN_BYTES", 256))
+STORAGE_ZSTD_LEVEL = int(os.getenv("STORAGE_ZSTD_LEVEL", 3))
+# Written by train-dictionary; 0 compresses without a dictionary.
+STORAGE_ZSTD_DICT_ID = int(os.getenv("STORAGE_ZSTD_DICT_ID", 0))
+
+_dictionaries = {}
+_local = threading.local()
+_system_prompts = TTLCache(ttl=3600)
+
+
+def _insert():
+    return postgresql_insert if engine.dialect.name == "postgresql" else sqlite_insert
+
+
+def _dictionary(db, dict_id):
+    dictionary = _dictionaries.get(dict_id)
+    if dictionary is None:
+        row = db.query(ZstdDictionary.data).filter(ZstdDictionary.dict_id == dict_id).first()
+        if row is None:
+            raise LookupError(f"zstd dictionary {dict_id} not found")
+        dictionary = _dictionaries[dict_id] = zstandard.ZstdCompressionDict(row.data)
+    return dictionary
+
+
+def _compressor(db):
+    # zstd (de)compressors aren't thread-safe, and preparing a dictionary is not free.
+    compressor = getattr(_local, "compressor", None)
+    if compressor is None:
+        dictionary = _dictionary(db, STORAGE_ZSTD_DICT_ID) if STORAGE_ZSTD_DICT_ID else None
+        compressor = _local.compressor = zstandard.ZstdCompressor(level=STORAGE_ZSTD_LEVEL, dict_data=dictionary)
+    return compressor
+
+
+def compress_text(db, value):
+    return base64.b64encode(_compressor(db).compress(value.encode())).decode("ascii")
+
+
+def decompress_text(db, value):
+    data = base64.b64decode(value)
+    dict_id = zstandard.get_frame_parameters(data).dict_id
+    decompressors = getattr(_local, "decompressors", None)
+    if decompressors is None:
+        decompressors = _local.decompressors = {}
+    decompressor = decompressors.get(dict_id)
+    if decompressor is None:
+        dictionary = _dictionary(db, dict_id) if dict_id else None
+        decompressor = decompressors[dict_id] = zstandard.ZstdDecompressor(dict_data=dictionary)
+    return decompressor.decompress(data).decode()
+
+
+def store_system_prompt(db, text):
+    sha256 = hashlib.sha256(text.encode()).hexdigest()
+    # Always issued, since the caller's transaction may still roll back; existing prompts write nothing.
+    db.execute(_insert()(SystemPrompt).values(sha256=sha256, text=text).on_conflict_do_nothing())
+    return sha256
+
+
+def system_prompt(db, sha256):
+    text = _system_prompts.get(sha256)
+    if text is None:
+        row = db.query(SystemPrompt.text).filter(SystemPrompt.sha256 == sha256).first()
+        if row is None:
+            raise LookupError(f"system prompt {sha256} not found")
+        text = row.text
+        _system_prompts.set(sha256, text)
+    return text
+
+
+def compact_result(db, entry):
+    """Converts a results entry to the compact format. The system prompt row is written
+    in the caller's transaction, so it commits together with the entry."""
+    userprompt, systemprompt = entry["userprompt"], entry["systemprompt"]
+    outcome = dict(entry["validation_outcome"])
+    if outcome.get("raw_llm_output") == f"{userprompt}\n{systemprompt}":
+        del outcome["raw_llm_output"]
+
+    compact = {key: value for key, value in entry.items() if key not in ("userprompt", "systemprompt")}
+    compact["storage"] = STORAGE_FORMAT
+    compact["validation_outcome"] = outcome
+    compact["systemprompt_sha256"] = store_system_prompt(db, systemprompt)
+    if len(userprompt.encode()) >= STORAGE_COMPRESS_MIN_BYTES:
+        compact["userprompt_zstd"] = compress_text(db, userprompt)
+    else:
+        compact["userprompt"] = userprompt
+    return compact
+
+
+def expand_result(db, entry):
+    if entry.get("storage") != STORAGE_FORMAT:
+        return entry
+    expanded = {key: value for key, value in entry.items() if key not in ("storage", "userprompt_zstd", "systemprompt_sha256")}
+    if "userprompt_zstd" in entry:
+        expanded["userprompt"] = decompress_text(db, entry["userprompt_zstd"])
+    expanded["systemprompt"] = system_prompt(db, entry["systemprompt_sha256"])
+    outcome = expanded["validation_outcome"] = dict(entry["validation_outcome"])
+    if "raw_llm_output" not in outcome:
+        outcome["raw_llm_output"] = f"{expanded['userprompt']}\n{expanded['systemprompt']}"
+    return expanded
+
+
+def train_dictionary(samples, size):
+    """Trains a dictionary on the prompts of the most recent events and stores it."""
+    db = SessionLocal()
+    try:
+        texts = []
+        for (results,) in db.query(Event.results).order_by(Event.id.desc()).limit(samples):
+            for entry in results or []:
+                # Attachment entries carry an outcome but no prompt.
+                userprompt = expand_result(db, entry).get("userprompt")
+                if userprompt:
+                    texts.append(userprompt.encode())
+        dictionary = zstandard.train_dictionary(size, texts)
+        db.merge(ZstdDictionary(dict_id=dictionary.dict_id(), data=dictionary.as_bytes()))
+        db.commit()
+        return dictionary.dict_id(), len(texts)
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("command", choices=["train-dictionary"])
+    parser.add_argument("--samples", type=int, default=10000, help="Most recent events to train on.")
+    parser.add_argument("--size", type=int, default=112640, help="Dictionary size in bytes.")
+    args = parser.parse_args()
+    dict_id, count = train_dictionary(args.samples, args.size)
+    print(f"Trained on {count} prompts. Set STORAGE_ZSTD_DICT_ID={dict_id} to compress with it.")
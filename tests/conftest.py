@@ -0,0 +1,27 @@
+import os
+import sys
+import tempfile
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Like benchmarks/load.py: a throwaway SQLite database and stub validators, set before
+# any app module reads its configuration. Assigned rather than defaulted, so that a
+# DATABASE_URL in the environment or .env is never touched by the tests.
+os.environ["DATABASE_URL"] = f"sqlite:///{tempfile.mkdtemp()}/test.db"
+os.environ["STUB_VALIDATORS_LATENCY_MS"] = "0"
+
+
+@pytest.fixture
+def db():
+    from database import Base, SessionLocal
+
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.rollback()
+        for table in reversed(Base.metadata.sorted_tables):
+            session.execute(table.delete())
+        session.commit()
+        session.close()
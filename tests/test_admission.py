@@ -0,0 +1,152 @@
+import asyncio
+import pytest
+from fastapi import HTTPException
+from admission import AdmissionController, admission_rejections
+from deadline import Deadline, DeadlineExceeded
+
+
+def controller(max_concurrency=2, max_queue_depth=8, per_key_concurrency=8, per_key_active=None):
+    return AdmissionController(max_concurrency, max_queue_depth, per_key_concurrency, 1.0, per_key_active)
+
+
+def rejections(reason):
+    return admission_rejections._values.get((reason,), 0)
+
+
+async def hold(admission, api_key, started, release):
+    async with admission.admit(api_key):
+        started.set()
+        await release.wait()
+
+
+def test_rejects_keys_over_their_concurrency_limit():
+    async def main():
+        admission = controller(per_key_concurrency=1)
+        started, release = asyncio.Event(), asyncio.Event()
+        task = asyncio.create_task(hold(admission, "a", started, release))
+        await started.wait()
+        with pytest.raises(HTTPException) as rejected:
+            admission.check("a")
+        admission.check("b")
+        release.set()
+        await task
+        return rejected.value
+
+    rejected = asyncio.run(main())
+    assert rejected.status_code == 429
+    assert "Retry-After" in rejected.headers
+
+
+def test_sheds_load_once_the_queue_is_full():
+    async def main():
+        admission = controller(max_concurrency=1, max_queue_depth=1)
+        release = asyncio.Event()
+        running, queued = asyncio.Event(), asyncio.Event()
+        tasks = [asyncio.create_task(hold(admission, "running", running, release))]
+        await running.wait()
+        tasks.append(asyncio.create_task(hold(admission, "queued", queued, release)))
+        while not admission.waiting:
+            await asyncio.sleep(0)
+        with pytest.raises(HTTPException) as rejected:
+            admission.check("rejected")
+        release.set()
+        await asyncio.gather(*tasks)
+        return rejected.value
+
+    assert asyncio.run(main()).status_code == 503
+
+
+def test_one_key_cannot_hold_every_slot():
+    async def main():
+        admission = controller(max_concurrency=2, per_key_active=1)
+        release = asyncio.Event()
+        first, second, other = asyncio.Event(), asyncio.Event(), asyncio.Event()
+        tasks = [
+            asyncio.create_task(hold(admission, "busy", first, release)),
+            asyncio.create_task(hold(admission, "busy", second, release)),
+        ]
+        await first.wait()
+        await asyncio.sleep(0.01)
+        # The busy key's second request waits for its own slot, leaving one for others.
+        assert not second.is_set()
+        tasks.append(asyncio.create_task(hold(admission, "other", other, release)))
+        await asyncio.wait_for(other.wait(), 1)
+        release.set()
+        await asyncio.gather(*tasks)
+        return admission
+
+    admission = asyncio.run(main())
+    assert admission.active == 0 and admission.waiting == 0
+    assert not admission.per_key and not admission._key_slots
+
+
+def test_requests_without_a_deadline_are_shed_after_the_controllers():
+    async def main():
+        admission = AdmissionController(1, 8, 8, 0.05)
+        started, release = asyncio.Event(), asyncio.Event()
+        task = asyncio.create_task(hold(admission, "a", started, release))
+        await started.wait()
+        with pytest.raises(HTTPException) as rejected:
+            async with admission.admit("b"):
+                pass
+        release.set()
+        await task
+        return rejected.value
+
+    assert asyncio.run(main()).status_code == 503
+
+
+def test_requests_whose_deadline_passes_while_queued_time_out():
+    async def main():
+        admission = controller(max_concurrency=1)
+        started, release = asyncio.Event(), asyncio.Event()
+        task = asyncio.create_task(hold(admission, "a", started, release))
+        await started.wait()
+        with pytest.raises(DeadlineExceeded):
+            async with admission.admit("b", Deadline(0.05)):
+                pass
+        release.set()
+        await task
+        return admission
+
+    shed = rejections("deadline")
+    admission = asyncio.run(main())
+    assert rejections("deadline") == shed
+    assert admission.waiting == 0 and not admission.per_key
+
+
+def test_expired_deadlines_are_not_admitted():
+    async def main():
+        admission = controller()
+        with pytest.raises(DeadlineExceeded):
+            async with admission.admit("a", Deadline(0)):
+                pass
+        return admission
+
+    assert not asyncio.run(main()).per_key
+
+
+def test_cancel_wakes_a_queued_request():
+    async def main():
+        admission = controller(max_concurrency=1)
+        started, release = asyncio.Event(), asyncio.Event()
+        task = asyncio.create_task(hold(admission, "a", started, release))
+        await started.wait()
+        deadline = Deadline(10)
+        asyncio.get_running_loop().call_later(0.05, deadline.cancel)
+        with pytest.raises(DeadlineExceeded):
+            async with admission.admit("b", deadline):
+                pass
+        release.set()
+        await task
+        # The cancelled request's slot went back to the pool.
+        async with admission.admit("c", Deadline(1)):
+            pass
+
+    asyncio.run(asyncio.wait_for(main(), 2))
+
+
+def test_check_leaves_no_state_for_requests_that_never_run():
+    admission = controller()
+    admission.check("rejected-later")
+    assert not admission.per_key
@@ -0,0 +1,106 @@
+import asyncio
+import threading
+import pytest
+import attachments
+import config
+from attachments import AttachmentPipeline, UnsupportedAttachment, extract_chunks
+from benchmarks.stubs import FAIL_MARKER
+from database import Api, AttachmentJob, Event
+
+
+class FakeListValidator:
+    """Scores every text in one call, 0.9 for texts mentioning an attack."""
+    threshold = 0.5
+
+    def __init__(self):
+        self.calls = []
+
+    def _inference(self, texts):
+        self.calls.append((threading.current_thread().name, list(texts)))
+        return [0.9 if "attack" in text else 0.1 for text in texts]
+
+
+def test_extracts_csv_rows_in_chunks(tmp_path):
+    path = tmp_path / "table.csv"
+    path.write_text("name,cost\n" + "".join(f"item{i},{i}\n" for i in range(100)))
+    chunks = list(extract_chunks(str(path), "csv", chunk_chars=100))
+
+    assert all(len(chunk) == 100 for chunk in chunks[:-1])
+    text = "".join(chunks)
+    assert text.startswith("name\tcost\nitem0\t0\nitem1\t1")
+    assert text.endswith("item99\t99")
+
+
+def test_extracts_plain_text_without_blank_lines(tmp_path):
+    path = tmp_path / "notes.txt"
+    path.write_text("first line\n\n   \nsecond line\n")
+    assert list(extract_chunks(str(path), "text")) == ["first line\nsecond line"]
+
+
+def test_rejects_images(tmp_path):
+    with pytest.raises(UnsupportedAttachment):
+        next(extract_chunks(str(tmp_path / "scan.png"), "file"))
+    with pytest.raises(UnsupportedAttachment):
+        next(extract_chunks(str(tmp_path / "scan.bin"), "image"))
+
+
+def test_list_validators_score_each_text(monkeypatch):
+    monkeypatch.setitem(config._validator_instances, "DetectJailbreak", FakeListValidator())
+    outcomes, _ = config.run_list_validator("DetectJailbreak", ["hello", "an attack"])
+    assert [outcome["validation_passed"] for outcome in outcomes] == [True, False]
+    assert outcomes[1]["validation_summaries"][0]["validator_name"] == "DetectJailbreak"
+
+
+@pytest.fixture
+def list_validator(monkeypatch):
+    validator = FakeListValidator()
+    monkeypatch.setitem(config._validator_instances, "DetectJailbreak", validator)
+    monkeypatch.setattr(attachments, "list_validators", {"DetectJailbreak"})
+    monkeypatch.setattr(attachments, "ATTACHMENT_CHUNK_CONCURRENCY", 2)
+    return validator
+
+
+def run_job(db, tmp_path, text):
+    api = Api(sub="alice", api_key="alice-key", input_validators="DetectJailbreak,MentionsDrugs",
+              output_validators="ValidJson", selected_model="gpt-4o")
+    db.add(api)
+    db.commit()
+    event = Event(event_id="event", api_id=api.id, results=[])
+    db.add(event)
+    db.commit()
+    path = tmp_path / "upload.txt"
+    path.write_text(text)
+
+    async def main():
+        pipeline = AttachmentPipeline(1, 10)
+        await pipeline.start()
+        try:
+            job_id = pipeline.submit(db, api.id, event, str(path), "text")
+            await asyncio.wait_for(pipeline.queue.join(), 10)
+        finally:
+            await pipeline.stop()
+        return job_id
+
+    job_id = asyncio.run(main())
+    db.expire_all()
+    return db.query(AttachmentJob).filter(AttachmentJob.job_id == job_id).one()
+
+
+def test_chunks_are_batched_for_list_validators(db, tmp_path, list_validator):
+    chunk_chars = attachments.ATTACHMENT_CHUNK_CHARS
+    chunks = ["a" * chunk_chars, "attack".ljust(chunk_chars, "b"), "c" * chunk_chars,
+              FAIL_MARKER.ljust(chunk_chars, "d"), "e" * 10]
+    job = run_job(db, tmp_path, "".join(chunks))
+
+    assert job.status == "done", job.error
+    assert [texts for _, texts in list_validator.calls] == [chunks[0:2], chunks[2:4], chunks[4:]]
+    assert all(thread.startswith("attachment-validator") for thread, _ in list_validator.calls)
+    assert job.result["chunks"] == 5
+    failed = {chunk["chunk"]: chunk["validation_outcome"] for chunk in job.result["failed_chunks"]}
+    assert set(failed) == {1, 3}
+    assert [summary["validator_name"] for summary in failed[1]["validation_summaries"]] == ["DetectJailbreak"]
+    assert "offset" not in job.result["failed_chunks"][0]
+
+
+def test_missing_jobs_are_skipped():
+    asyncio.run(AttachmentPipeline(1, 10).process("no-such-job"))
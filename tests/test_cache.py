@@ -0,0 +1,42 @@
+from types import SimpleNamespace
+import pytest
+import cache
+from cache import TTLCache
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(cache, "time", SimpleNamespace(monotonic=lambda: now[0]))
+    return now
+
+
+def test_entries_expire_after_ttl(clock):
+    entries = TTLCache(ttl=5)
+    entries.set("key", "value")
+    clock[0] += 4.9
+    assert entries.get("key") == "value"
+    clock[0] += 0.1
+    assert entries.get("key") is None
+
+
+def test_evicts_least_recently_used(clock):
+    entries = TTLCache(ttl=60, maxsize=2)
+    entries.set("a", 1)
+    entries.set("b", 2)
+    entries.get("a")
+    entries.set("c", 3)
+    assert entries.get("a") == 1
+    assert entries.get("b") is None
+    assert entries.get("c") == 3
+
+
+def test_invalidate_removes_matching_entries(clock):
+    entries = TTLCache(ttl=60)
+    for cursor in (None, 10):
+        entries.set(("alice", cursor, 50), "page")
+    entries.set(("bob", None, 50), "page")
+    entries.invalidate(lambda key: key[0] == "alice")
+    assert entries.get(("alice", None, 50)) is None
+    assert entries.get(("alice", 10, 50)) is None
+    assert entries.get(("bob", None, 50)) == "page"
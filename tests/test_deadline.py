@@ -0,0 +1,90 @@
+import asyncio
+import time
+import pytest
+from deadline import NO_DEADLINE, Deadline, DeadlineExceeded, current_deadline, deadline_scope
+
+
+def test_expires_after_timeout():
+    deadline = Deadline(0.05)
+    assert not deadline.expired()
+    time.sleep(0.06)
+    assert deadline.expired()
+    assert deadline.remaining() == 0.0
+
+
+def test_without_timeout_never_expires():
+    deadline = Deadline()
+    assert not deadline.expired()
+    assert deadline.remaining() is None
+    assert deadline.wall_clock() is None
+
+
+def test_run_returns_the_result():
+    async def work():
+        await asyncio.sleep(0.01)
+        return 42
+
+    assert asyncio.run(Deadline(1).run(work())) == 42
+
+
+def test_run_cancels_work_that_outlives_the_deadline():
+    cancelled = []
+
+    async def work():
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.append(True)
+            raise
+
+    async def main():
+        with pytest.raises(DeadlineExceeded):
+            await Deadline(0.05).run(work())
+        await asyncio.sleep(0)
+
+    asyncio.run(main())
+    assert cancelled == [True]
+
+
+def test_cancelling_run_cancels_the_work():
+    cancelled = []
+
+    async def work():
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.append(True)
+            raise
+
+    async def main():
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(Deadline().run(work()), 0.05)
+        await asyncio.sleep(0)
+
+    asyncio.run(main())
+    assert cancelled == [True]
+
+
+def test_cancel_wakes_a_running_wait():
+    async def main():
+        deadline = Deadline(10)
+        asyncio.get_running_loop().call_later(0.05, deadline.cancel)
+        started = time.monotonic()
+        with pytest.raises(DeadlineExceeded):
+            await deadline.run(asyncio.sleep(10))
+        return time.monotonic() - started
+
+    assert asyncio.run(main()) < 1
+
+
+def test_no_deadline_works_across_event_loops():
+    # NO_DEADLINE is shared by the whole process, but each asyncio.run has its own loop.
+    for _ in range(2):
+        assert asyncio.run(NO_DEADLINE.run(asyncio.sleep(0, result="done"))) == "done"
+
+
+def test_deadline_scope_sets_and_restores_the_current_deadline():
+    deadline = Deadline(1)
+    with deadline_scope(deadline):
+        assert current_deadline.get() is deadline
+    assert current_deadline.get() is NO_DEADLINE
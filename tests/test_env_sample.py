@@ -0,0 +1,24 @@
+import os
+import subprocess
+import sys
+from dotenv import dotenv_values
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Modules that read their configuration from the environment at import time.
+CONFIGURED_MODULES = [
+    "admission", "attachments", "cache", "config", "executor", "export", "main", "model_server",
+    "rate_limit", "runtime", "stats", "storage", "tracing",
+]
+
+
+def test_modules_import_with_env_sample_values():
+    # The values python-dotenv would load from a .env copied from env_sample, with
+    # empty entries as "". The database stays the tests' SQLite file.
+    env = {**os.environ, **{key: value or "" for key, value in dotenv_values(os.path.join(ROOT, "env_sample")).items()}}
+    env["DATABASE_URL"] = os.environ["DATABASE_URL"]
+    env["STUB_VALIDATORS_LATENCY_MS"] = os.environ["STUB_VALIDATORS_LATENCY_MS"]
+    result = subprocess.run(
+        [sys.executable, "-c", "; ".join(f"import {module}" for module in CONFIGURED_MODULES)],
+        cwd=ROOT, env=env, capture_output=True, text=True,
+    )
+    assert result.returncode == 0, result.stderr
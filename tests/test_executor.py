@@ -0,0 +1,80 @@
+import asyncio
+import time
+import pytest
+import executor
+from deadline import Deadline
+
+COSTS = {"SecretsPresent": 0.001, "MentionsDrugs": 0.2, "DetectPII": 0.3, "DetectJailbreak": 0.9}
+VALIDATORS = ["DetectJailbreak", "DetectPII", "SecretsPresent", "MentionsDrugs"]
+FAILING, SLOW = set(), set()
+
+
+@pytest.fixture
+def calls(monkeypatch):
+    """Replaces the validators with fakes that fail when named in FAILING and sleep when
+    named in SLOW; returns the names in the order they ran."""
+    calls = []
+
+    def run_validator(validator_name, text):
+        calls.append(validator_name)
+        if validator_name in SLOW:
+            time.sleep(0.2)
+        passed = validator_name not in FAILING
+        outcome = {
+            "validation_passed": passed,
+            "error": None if passed else f"{validator_name} failed",
+            "validation_summaries": [] if passed else [{
+                "validator_name": validator_name, "validator_status": "fail",
+                "failure_reason": "fake", "error_spans": [],
+            }],
+            "raw_llm_output": text,
+        }
+        return outcome, COSTS[validator_name]
+
+    monkeypatch.setattr(executor, "run_validator", run_validator)
+    monkeypatch.setattr(executor, "validator_costs", dict(COSTS))
+    FAILING.clear()
+    SLOW.clear()
+    return calls
+
+
+def test_fail_fast_runs_cheapest_first_and_skips_the_rest(calls):
+    FAILING.add("MentionsDrugs")
+    outcome, statuses = asyncio.run(executor.run_validators("input", VALIDATORS, "text", policy="fail_fast"))
+
+    assert calls == ["SecretsPresent", "MentionsDrugs"]
+    assert not outcome["validation_passed"]
+    assert statuses["SecretsPresent"][0] == "pass"
+    assert statuses["MentionsDrugs"][0] == "fail"
+    assert statuses["DetectPII"] == ("skipped", None)
+    assert statuses["DetectJailbreak"] == ("skipped", None)
+    skipped = {summary["validator_name"]: summary for summary in outcome["validation_summaries"]
+               if summary["validator_status"] == "skipped"}
+    assert set(skipped) == {"DetectPII", "DetectJailbreak"}
+
+
+def test_fail_fast_runs_everything_when_all_pass(calls):
+    outcome, statuses = asyncio.run(executor.run_validators("input", VALIDATORS, "text", policy="fail_fast"))
+    assert calls == ["SecretsPresent", "MentionsDrugs", "DetectPII", "DetectJailbreak"]
+    assert outcome["validation_passed"]
+    assert {status for status, _ in statuses.values()} == {"pass"}
+
+
+def test_full_report_runs_every_validator_after_a_failure(calls):
+    FAILING.add("SecretsPresent")
+    outcome, statuses = asyncio.run(executor.run_validators("input", VALIDATORS, "text"))
+    assert sorted(calls) == sorted(VALIDATORS)
+    assert not outcome["validation_passed"]
+    assert "skipped" not in {status for status, _ in statuses.values()}
+
+
+def test_validators_past_the_deadline_are_reported_as_timed_out(calls):
+    SLOW.add("MentionsDrugs")
+    outcome, statuses = asyncio.run(executor.run_validators(
+        "input", VALIDATORS, "text", policy="fail_fast", deadline=Deadline(0.05)
+    ))
+    assert not outcome["validation_passed"]
+    assert statuses["SecretsPresent"][0] == "pass"
+    for name in ["MentionsDrugs", "DetectPII", "DetectJailbreak"]:
+        assert statuses[name] == ("timed_out", None)
+    assert "DetectJailbreak" not in calls
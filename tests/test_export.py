@@ -0,0 +1,57 @@
+import io
+import json
+import pytest
+import export
+from database import Event
+from storage import compact_result
+
+
+def add_events(db, api_id, count):
+    events = [
+        Event(event_id=f"event-{i}", api_id=api_id, results=[compact_result(db, {
+            "type": "input",
+            "userprompt": f"prompt {i}",
+            "systemprompt": "You are a helpful assistant.",
+            "validation_outcome": {"validation_passed": True, "error": None, "validation_summaries": []},
+        })])
+        for i in range(count)
+    ]
+    db.add_all(events)
+    db.commit()
+    return [event.id for event in events]
+
+
+def lines(chunks):
+    return [json.loads(line) for chunk in chunks for line in chunk.splitlines()]
+
+
+def test_ndjson_streams_a_keys_events_in_batches(db, monkeypatch):
+    monkeypatch.setattr(export, "EXPORT_BATCH_SIZE", 2)
+    add_events(db, 2, 2)
+    ids = add_events(db, 1, 5)
+
+    chunks = list(export.export_stream("ndjson", 1))
+    # One chunk per batch rather than one response-sized string.
+    assert len(chunks) == 3
+    rows = lines(chunks)
+    assert [row["id"] for row in rows] == ids
+    assert rows[0]["event_id"] == "event-0"
+    assert rows[0]["results"][0]["systemprompt"] == "You are a helpful assistant."
+    assert rows[0]["results"][0]["userprompt"] == "prompt 0"
+
+
+def test_since_id_resumes_after_the_last_exported_event(db):
+    ids = add_events(db, 1, 4)
+    rows = lines(export.export_stream("ndjson", 1, since_id=ids[1]))
+    assert [row["id"] for row in rows] == ids[2:]
+    assert lines(export.export_stream("ndjson", 1, since_id=ids[-1])) == []
+
+
+def test_parquet_holds_the_same_rows(db, monkeypatch):
+    pq = pytest.importorskip("pyarrow.parquet")
+    monkeypatch.setattr(export, "EXPORT_BATCH_SIZE", 2)
+    ids = add_events(db, 1, 3)
+
+    table = pq.read_table(io.BytesIO(b"".join(export.export_stream("parquet", 1))))
+    assert table.column("id").to_pylist() == ids
+    assert json.loads(table.column("results")[0].as_py())[0]["userprompt"] == "prompt 0"
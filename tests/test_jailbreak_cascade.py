@@ -0,0 +1,63 @@
+import importlib
+import importlib.util
+import os
+import random
+import sys
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+STAGES = ["_match_known_malicious_prompts", "_predict_saturation", "_predict_jailbreak"]
+PROMPTS = [f"prompt {i}" for i in range(200)]
+
+
+@pytest.fixture(scope="module")
+def DetectJailbreak():
+    pytest.importorskip("torch")
+    pytest.importorskip("transformers")
+    # The vendored copy in this repo rather than an installed package.
+    package = os.path.join(ROOT, "modifications", "guardrails_grhub_detect_jailbreak")
+    spec = importlib.util.spec_from_file_location(
+        "detect_jailbreak_vendored", os.path.join(package, "__init__.py"), submodule_search_locations=[package]
+    )
+    sys.modules[spec.name] = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(sys.modules[spec.name])
+    return importlib.import_module("detect_jailbreak_vendored.main").DetectJailbreak
+
+
+def validator(DetectJailbreak, cascade, threshold=0.81):
+    """A DetectJailbreak whose sub-models are replaced by fixed pseudo-random scores;
+    validator.calls maps each stage to the prompts it scored."""
+    instance = DetectJailbreak.__new__(DetectJailbreak)
+    instance.cascade = cascade
+    instance.threshold = threshold
+    instance.calls = {}
+
+    def fake(stage):
+        def score(prompts):
+            instance.calls.setdefault(stage, []).extend(prompts)
+            return [random.Random(f"{stage}:{prompt}").random() for prompt in prompts]
+        score.__name__ = stage
+        return score
+
+    for stage in STAGES:
+        setattr(instance, stage, fake(stage))
+    return instance
+
+
+@pytest.mark.parametrize("threshold", [0.5, 0.81, 0.95])
+def test_cascade_gives_the_same_verdicts(DetectJailbreak, threshold):
+    full = validator(DetectJailbreak, cascade=False, threshold=threshold).predict_jailbreak(PROMPTS)
+    cascaded = validator(DetectJailbreak, cascade=True, threshold=threshold)
+    scores = cascaded.predict_jailbreak(PROMPTS)
+
+    assert [score > threshold for score in scores] == [score > threshold for score in full]
+    # Prompts that pass ran every stage, so their score is exact.
+    assert [score for score in scores if score <= threshold] == [score for score in full if score <= threshold]
+    assert len(cascaded.calls["_predict_jailbreak"]) < len(PROMPTS)
+
+
+def test_other_reductions_run_every_sub_model(DetectJailbreak):
+    cascaded = validator(DetectJailbreak, cascade=True)
+    scores = cascaded.predict_jailbreak(PROMPTS, reduction_function=None)
+    assert set(scores[0]) == {"known_attack", "saturation_attack", "other_attack"}
+    assert all(len(cascaded.calls[stage]) == len(PROMPTS) for stage in STAGES)
@@ -0,0 +1,51 @@
+import pytest
+from fastapi import HTTPException
+from fastapi.security import HTTPAuthorizationCredentials
+from jose import jwt
+from cache import jwks_cache
+
+main = pytest.importorskip("main")
+
+JWKS = {"keys": [{"kty": "RSA", "kid": "current", "use": "sig", "n": "n", "e": "AQAB"}]}
+
+
+class FakeResponse:
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return JWKS
+
+
+@pytest.fixture
+def fetches(monkeypatch):
+    fetches = []
+    monkeypatch.setattr(main.requests, "get", lambda url: fetches.append(url) or FakeResponse())
+    monkeypatch.setattr(main, "jwks_fetched_at", float("-inf"))
+    jwks_cache.invalidate(lambda key: True)
+    yield fetches
+    jwks_cache.invalidate(lambda key: True)
+
+
+def sign_in(kid):
+    token = jwt.encode({"sub": "alice"}, "secret", algorithm="HS256", headers={"kid": kid})
+    with pytest.raises(HTTPException) as rejected:
+        main.get_current_user(HTTPAuthorizationCredentials(scheme="Bearer", credentials=token))
+    return rejected.value
+
+
+def test_unknown_kids_force_at_most_one_fetch_per_interval(fetches, monkeypatch):
+    for _ in range(5):
+        assert sign_in("made-up").status_code == 401
+    assert len(fetches) == 1
+
+    monkeypatch.setattr(main, "jwks_fetched_at", main.jwks_fetched_at - main.JWKS_MIN_REFRESH_S)
+    sign_in("made-up")
+    assert len(fetches) == 2
+
+
+def test_known_kids_use_the_cache(fetches):
+    for _ in range(3):
+        # The signature doesn't verify against the fake key, but the key is found.
+        assert sign_in("current").detail == "Invalid token"
+    assert len(fetches) == 1
@@ -0,0 +1,112 @@
+import asyncio
+import os
+import tempfile
+import threading
+import time
+from contextlib import asynccontextmanager
+import pytest
+import model_server
+from deadline import Deadline, DeadlineExceeded, deadline_scope
+from model_server import ModelHost, ModelServerClient
+
+
+class FakeModel:
+    """Batched validator stand-in: doubles its inputs, slowly enough for requests to queue."""
+
+    def __init__(self, seconds=0.2):
+        self.seconds = seconds
+        self.forward_passes = []
+        self._lock = threading.Lock()
+
+    def _inference_local(self, inputs):
+        with self._lock:
+            self.forward_passes.append(list(inputs))
+        time.sleep(self.seconds)
+        return [x * 2 for x in inputs]
+
+
+@asynccontextmanager
+async def model_host(model):
+    host = ModelHost({"DetectJailbreak": model})
+    await host.start_batchers()
+    path = os.path.join(tempfile.mkdtemp(), "models.sock")
+    server = await asyncio.start_unix_server(host.handle_connection, path=path)
+    try:
+        yield ModelServerClient(path, timeout=5)
+    finally:
+        server.close()
+
+
+def shared_memory_blocks():
+    return {name for name in os.listdir("/dev/shm") if name.startswith("psm_")}
+
+
+def test_concurrent_requests_share_a_forward_pass():
+    model = FakeModel()
+
+    async def main():
+        async with model_host(model) as client:
+            loop = asyncio.get_running_loop()
+            # The first request occupies the model, so the next two are batched together.
+            first = loop.run_in_executor(None, client.infer, "DetectJailbreak", [1])
+            await asyncio.sleep(0.05)
+            rest = [loop.run_in_executor(None, client.infer, "DetectJailbreak", inputs) for inputs in ([2], [3, 4])]
+            return await first, await asyncio.gather(*rest)
+
+    first, rest = asyncio.run(main())
+    assert first == [2]
+    assert rest == [[4], [6, 8]]
+    assert [sorted(batch) for batch in model.forward_passes] == [[1], [2, 3, 4]]
+
+
+def test_cancelled_requests_are_dropped_from_the_batch():
+    model = FakeModel()
+
+    async def main():
+        async with model_host(model) as client:
+            loop = asyncio.get_running_loop()
+            first = loop.run_in_executor(None, client.infer, "DetectJailbreak", [1])
+            await asyncio.sleep(0.05)
+            deadline = Deadline()
+
+            def cancelled_call():
+                with deadline_scope(deadline):
+                    client.infer("DetectJailbreak", [5])
+
+            cancelled = loop.run_in_executor(None, cancelled_call)
+            kept = loop.run_in_executor(None, client.infer, "DetectJailbreak", [7])
+            await asyncio.sleep(0.05)
+            deadline.cancel()
+            with pytest.raises(DeadlineExceeded):
+                await cancelled
+            return await first, await kept
+
+    assert asyncio.run(main()) == ([2], [14])
+    assert model.forward_passes == [[1], [7]]
+
+
+def test_expired_deadlines_are_not_sent():
+    model = FakeModel()
+
+    async def main():
+        async with model_host(model) as client:
+            with deadline_scope(Deadline(0)):
+                with pytest.raises(DeadlineExceeded):
+                    client.infer("DetectJailbreak", [1])
+
+    asyncio.run(main())
+    assert model.forward_passes == []
+
+
+def test_large_payloads_travel_through_shared_memory(monkeypatch):
+    monkeypatch.setattr(model_server, "SHM_THRESHOLD", 1024)
+    model = FakeModel(seconds=0)
+    before = shared_memory_blocks()
+
+    async def main():
+        async with model_host(model) as client:
+            return await asyncio.get_running_loop().run_in_executor(None, client.infer, "DetectJailbreak", [3] * 10000)
+
+    assert asyncio.run(main()) == [6] * 10000
+    # Every block was unlinked by its reader.
+    assert shared_memory_blocks() - before == set()
@@ -0,0 +1,97 @@
+import uuid
+import fakeredis
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import inspect
+from cache import prev_keys_cache
+from database import Api, engine
+from rate_limit import limiter
+
+main = pytest.importorskip("main")
+
+
+@pytest.fixture
+def client(monkeypatch):
+    """A client signed in as alice, with the change tokens in fakeredis; counts page queries."""
+    monkeypatch.setattr(limiter, "redis", fakeredis.aioredis.FakeRedis(decode_responses=True))
+    monkeypatch.setitem(main.app.dependency_overrides, main.get_current_user, lambda: {"sub": "alice"})
+    queries = []
+    prev_keys_page = main.prev_keys_page
+    monkeypatch.setattr(main, "prev_keys_page", lambda *args: queries.append(args) or prev_keys_page(*args))
+    prev_keys_cache.invalidate(lambda key: True)
+    client = TestClient(main.app)
+    client.queries = queries
+    return client
+
+
+def add_keys(db, sub, count):
+    keys = [
+        Api(sub=sub, api_key=f"{sub}-{uuid.uuid4().hex}", input_validators="DetectPII", output_validators="ValidJson",
+            selected_model="gpt-4o")
+        for _ in range(count)
+    ]
+    db.add_all(keys)
+    db.commit()
+    return [key.id for key in keys]
+
+
+def test_pages_walk_a_users_keys_in_id_order(db):
+    add_keys(db, "other", 3)
+    ids = add_keys(db, "alice", 5)
+    add_keys(db, "other", 3)
+
+    pages, cursor = [], None
+    while True:
+        page = main.prev_keys_page(db, "alice", cursor, 2)
+        pages.append([int(key["key_id"]) for key in page["api_keys"]])
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+        cursor = int(cursor)
+
+    assert pages == [ids[0:2], ids[2:4], ids[4:5]]
+    first = main.prev_keys_page(db, "alice", None, 1)["api_keys"][0]
+    assert first["api_key"] == "alic"
+    assert first["input_validators"] == ["DetectPII"]
+
+
+def test_user_without_keys(db):
+    assert main.prev_keys_page(db, "nobody", None, 10) == {"message": "No API keys found for this user"}
+    assert main.prev_keys_page(db, "nobody", 10, 10) == {"api_keys": [], "next_cursor": None}
+
+
+def test_keyset_index_exists():
+    indexes = {index["name"]: index["column_names"] for index in inspect(engine).get_indexes("apis")}
+    assert indexes["ix_apis_sub_id"] == ["sub", "id"]
+
+
+def test_unchanged_pages_are_confirmed_without_a_query(db, client):
+    add_keys(db, "alice", 3)
+    first = client.get("/prev_keys")
+    assert first.status_code == 200
+    etag = first.headers["ETag"]
+
+    # Even once the worker's cached page has expired.
+    prev_keys_cache.invalidate(lambda key: True)
+    again = client.get("/prev_keys", headers={"If-None-Match": etag})
+    assert again.status_code == 304
+    assert again.headers["ETag"] == etag
+    assert len(client.queries) == 1
+
+
+def test_writes_change_the_etag(db, client):
+    ids = add_keys(db, "alice", 2)
+    etag = client.get("/prev_keys").headers["ETag"]
+
+    assert client.patch(f"/keys/{ids[0]}", json={"selected_model": "gpt-4o-mini"}).status_code == 200
+    changed = client.get("/prev_keys", headers={"If-None-Match": etag})
+    assert changed.status_code == 200
+    assert changed.headers["ETag"] != etag
+    assert changed.json()["api_keys"][0]["selected_model"] == "gpt-4o-mini"
+
+
+def test_falls_back_to_content_etags_without_redis(db, client, monkeypatch):
+    monkeypatch.setattr(limiter, "redis", None)
+    add_keys(db, "alice", 2)
+    etag = client.get("/prev_keys").headers["ETag"]
+    assert client.get("/prev_keys", headers={"If-None-Match": etag}).status_code == 304
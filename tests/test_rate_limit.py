@@ -0,0 +1,88 @@
+import asyncio
+import logging
+import time
+from types import SimpleNamespace
+import fakeredis
+import pytest
+import rate_limit
+from rate_limit import HybridRateLimiter, TokenBucket
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    # Starts at the real time, since Redis expires the shared windows by wall clock.
+    now = [time.time()]
+    monkeypatch.setattr(rate_limit, "time", SimpleNamespace(monotonic=lambda: now[0], time=lambda: now[0]))
+    return now
+
+
+def test_bucket_allows_a_burst_up_to_capacity(clock):
+    bucket = TokenBucket(capacity=3, refill_per_second=1)
+    assert [bucket.take() for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert bucket.take() == pytest.approx(1.0)
+
+
+def test_bucket_refills_over_time(clock):
+    bucket = TokenBucket(capacity=2, refill_per_second=2)
+    bucket.take()
+    bucket.take()
+    assert bucket.take() == pytest.approx(0.5)
+    clock[0] += 0.5
+    assert bucket.take() == 0.0
+    assert not bucket.is_full()
+    clock[0] += 1
+    assert bucket.is_full()
+
+
+def test_limits_each_key_separately(clock):
+    limiter = HybridRateLimiter(sync_interval=1)
+    assert limiter.hit("a", 1, 60) == 0.0
+    assert limiter.hit("a", 1, 60) > 0
+    assert limiter.hit("b", 1, 60) == 0.0
+
+
+def test_workers_share_the_limit_through_redis(clock):
+    server = fakeredis.FakeServer()
+    workers = [HybridRateLimiter(sync_interval=1) for _ in range(2)]
+    for worker in workers:
+        worker.redis = fakeredis.aioredis.FakeRedis(server=server)
+
+    async def main():
+        # Each worker stays within its own bucket, but together they exceed 3 per minute.
+        for worker in workers:
+            assert worker.hit("key", 3, 60) == 0.0
+            assert worker.hit("key", 3, 60) == 0.0
+        for worker in workers:
+            await worker.sync()
+        # The second sync saw the global count pass the limit; the first worker only
+        # finds out with its next sync.
+        assert workers[1].hit("key", 3, 60) > 0
+        assert workers[0].hit("key", 3, 60) == 0.0
+        await workers[0].sync()
+        assert workers[0].hit("key", 3, 60) > 0
+
+    asyncio.run(main())
+    # Blocked only until the shared window ends.
+    clock[0] += 60
+    assert workers[0].hit("key", 3, 60) == 0.0
+
+
+class BrokenRedis:
+    def pipeline(self, transaction=False):
+        raise ConnectionError("redis is down")
+
+
+def test_redis_outage_is_logged_once_and_limits_stay_local(clock, caplog):
+    limiter = HybridRateLimiter(sync_interval=1)
+    limiter.redis = BrokenRedis()
+
+    async def main():
+        for _ in range(3):
+            limiter.hit("key", 2, 60)
+            await limiter.sync()
+
+    with caplog.at_level(logging.WARNING, logger="rate_limit"):
+        asyncio.run(main())
+    assert len(caplog.records) == 1
+    assert "redis is down" in caplog.records[0].getMessage()
+    assert limiter.hit("key", 2, 60) > 0
@@ -0,0 +1,44 @@
+from datetime import datetime, timedelta, timezone
+import pytest
+from stats import combine_statuses, hour_bucket, record_validation_stats, validation_stats
+
+
+def test_upsert_adds_to_the_hour_row(db):
+    at = datetime(2026, 1, 1, 12, 30, tzinfo=timezone.utc)
+    record_validation_stats(db, 1, {"DetectPII": ("pass", 0.1), "ValidJson": ("fail", 0.02)}, at=at)
+    record_validation_stats(db, 1, {"DetectPII": ("fail", 0.3)}, at=at + timedelta(minutes=10))
+    record_validation_stats(db, 1, {"DetectPII": ("timed_out", None)}, at=at + timedelta(minutes=20))
+    record_validation_stats(db, 2, {"DetectPII": ("pass", 0.5)}, at=at)
+    db.commit()
+
+    rows = validation_stats(db, 1, start=at - timedelta(hours=1), end=at + timedelta(hours=1))
+    assert [row["validator_name"] for row in rows] == ["DetectPII", "ValidJson"]
+    pii = rows[0]
+    assert pii["hour"] == hour_bucket(at).isoformat()
+    assert (pii["passed"], pii["failed"], pii["skipped"], pii["timed_out"]) == (1, 1, 0, 1)
+    assert pii["failure_rate"] == 0.5
+    assert pii["avg_latency_ms"] == pytest.approx(200)
+
+
+def test_later_hours_get_their_own_rows(db):
+    at = datetime(2026, 1, 1, 12, tzinfo=timezone.utc)
+    for hour in range(3):
+        record_validation_stats(db, 1, {"DetectPII": ("pass", 0.1)}, at=at + timedelta(hours=hour))
+    db.commit()
+    rows = validation_stats(db, 1, start=at, end=at + timedelta(hours=3))
+    assert [row["passed"] for row in rows] == [1, 1, 1]
+
+
+def test_stats_range_is_bounded(db):
+    with pytest.raises(ValueError):
+        validation_stats(db, 1, start=datetime(2025, 1, 1), end=datetime(2026, 1, 1))
+
+
+def test_combine_statuses_counts_runs_as_one_validation():
+    combined = combine_statuses([
+        {"DetectPII": ("pass", 0.1), "ValidJson": ("pass", 0.01), "HasUrl": ("skipped", None)},
+        {"DetectPII": ("fail", 0.2), "ValidJson": ("timed_out", None), "HasUrl": ("pass", 0.01)},
+    ])
+    assert combined["DetectPII"] == ("fail", pytest.approx(0.3))
+    assert combined["ValidJson"] == ("timed_out", None)
+    assert combined["HasUrl"] == ("pass", 0.01)
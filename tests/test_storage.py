@@ -0,0 +1,71 @@
+import base64
+import random
+import zstandard
+import storage
+from database import Event, SystemPrompt
+
+
+def prompt(i):
+    rng = random.Random(i)
+    items = ", ".join(rng.sample(["revenue", "payroll", "travel", "hosting", "marketing", "legal", "rent"], 3))
+    return f"Summarize the quarterly report for team {rng.randint(1, 500)} and list the costs for {items}. " * 3
+
+
+def entry(userprompt, systemprompt="You are a helpful assistant."):
+    return {
+        "userprompt": userprompt,
+        "systemprompt": systemprompt,
+        "validation_outcome": {
+            "validation_passed": True,
+            "error": None,
+            "validation_summaries": [],
+            "raw_llm_output": f"{userprompt}\n{systemprompt}",
+        },
+    }
+
+
+def test_compress_round_trip(db):
+    text = prompt(1) * 4
+    compressed = storage.compress_text(db, text)
+    assert len(compressed) < len(text)
+    assert storage.decompress_text(db, compressed) == text
+
+
+def test_compact_result_round_trip(db):
+    short, long = entry("hi"), entry(prompt(2))
+    compact_short, compact_long = storage.compact_result(db, short), storage.compact_result(db, long)
+    db.commit()
+
+    assert compact_short["userprompt"] == "hi"
+    assert "userprompt" not in compact_long and "userprompt_zstd" in compact_long
+    assert "raw_llm_output" not in compact_long["validation_outcome"]
+    # Both entries reference the same stored system prompt.
+    assert db.query(SystemPrompt).count() == 1
+    assert storage.expand_result(db, compact_short) == short
+    assert storage.expand_result(db, compact_long) == long
+
+
+def test_expand_result_passes_legacy_entries_through(db):
+    legacy = entry("written before the compact format")
+    assert storage.expand_result(db, legacy) is legacy
+
+
+def test_train_dictionary(db):
+    for i in range(500):
+        results = [storage.compact_result(db, entry(prompt(i)))]
+        if i % 10 == 0:
+            # Attachment jobs add entries without prompts.
+            results.append({"type": "attachment", "attachment_job_id": str(i), "validation_outcome": {}})
+        db.add(Event(event_id=f"event-{i}", api_id=1, results=results))
+    db.commit()
+
+    dict_id, count = storage.train_dictionary(samples=1000, size=8192)
+    assert count == 500
+
+    # Frames compressed with the dictionary decompress through the stored copy.
+    text = prompt(1000)
+    dictionary = storage._dictionary(db, dict_id)
+    frame = zstandard.ZstdCompressor(dict_data=dictionary).compress(text.encode())
+    assert zstandard.get_frame_parameters(frame).dict_id == dict_id
+    assert len(frame) < len(zstandard.ZstdCompressor().compress(text.encode()))
+    assert storage.decompress_text(db, base64.b64encode(frame).decode()) == text
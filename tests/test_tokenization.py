@@ -0,0 +1,52 @@
+import importlib.util
+import os
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture
+def tokenization():
+    # Loaded from the vendored copy in this repo rather than an installed package.
+    path = os.path.join(ROOT, "modifications", "guardrails_grhub_detect_jailbreak", "tokenization.py")
+    spec = importlib.util.spec_from_file_location("detect_jailbreak_tokenization", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+class FakeTokenizer:
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, texts, **kwargs):
+        self.calls.append((texts, kwargs))
+        return {"input_ids": [[len(text)] for text in texts]}
+
+
+def test_encode_tokenizes_a_batch_in_one_padded_call(tokenization):
+    tokenizer = FakeTokenizer()
+    with tokenization.tokenization_scope() as scope:
+        encoded = tokenization.encode(tokenizer, ["a", "bb"], max_length=8)
+
+    assert encoded == {"input_ids": [[1], [2]]}
+    assert tokenizer.calls == [(
+        ["a", "bb"],
+        {"padding": True, "truncation": True, "max_length": 8, "return_tensors": "pt"},
+    )]
+    assert scope.tokenize_calls == 1
+    assert tokenization.STATS.snapshot()["tokenize_calls"] == 1
+
+
+def test_forward_passes_are_timed_per_scope_and_observed(tokenization):
+    observed = []
+    tokenization.add_forward_observer(lambda *args: observed.append(args))
+    with tokenization.tokenization_scope() as scope:
+        with tokenization.timed_forward("embedding", 3):
+            pass
+    with tokenization.timed_forward("text_classifier", 1):
+        pass
+
+    assert scope.forward_calls == 1
+    assert tokenization.STATS.snapshot()["forward_calls"] == 2
+    assert [(submodel, batch_size) for submodel, _, batch_size in observed] == [("embedding", 3), ("text_classifier", 1)]
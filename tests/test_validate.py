@@ -0,0 +1,53 @@
+import asyncio
+import pytest
+from fastapi.testclient import TestClient
+from admission import admission_rejections
+from database import Api, Event
+
+main = pytest.importorskip("main")
+
+
+@pytest.fixture
+def client(db):
+    api = Api(sub="alice", api_key="alice-key", input_validators="DetectPII,MentionsDrugs",
+              output_validators="ValidJson", selected_model="gpt-4o")
+    db.add(api)
+    db.commit()
+    db.add(Event(event_id="event", api_id=api.id, results=[]))
+    db.commit()
+    return TestClient(main.app)
+
+
+def validate(client, **headers):
+    return client.post(
+        "/validate",
+        headers={"X-API-Key": "alice-key", **headers},
+        data={"type": "input", "userprompt": "hello", "systemprompt": "system", "eventId": "event"},
+    )
+
+
+def test_validates_within_the_deadline(client):
+    response = validate(client, **{"X-Deadline-Ms": "10000"})
+    assert response.status_code == 200
+    assert response.json()["validation_outcome"]["validation_passed"]
+
+
+def test_deadline_expiring_before_inference_reports_timed_out(client, monkeypatch):
+    verify_session = main.verify_session
+
+    async def slow_verify_session(**kwargs):
+        await asyncio.sleep(0.02)
+        return await verify_session(**kwargs)
+
+    monkeypatch.setattr(main, "verify_session", slow_verify_session)
+    shed = admission_rejections._values.get(("deadline",), 0)
+    response = validate(client, **{"X-Deadline-Ms": "1"})
+
+    assert response.status_code == 200
+    assert "Retry-After" not in response.headers
+    outcome = response.json()["validation_outcome"]
+    assert not outcome["validation_passed"]
+    assert {summary["validator_name"]: summary["validator_status"] for summary in outcome["validation_summaries"]} == {
+        "DetectPII": "timed_out", "MentionsDrugs": "timed_out",
+    }
+    assert admission_rejections._values.get(("deadline",), 0) == shed
@@ -0,0 +1,162 @@
+import json
+import os
+import queue
+import secrets
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+import requests
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Spans are exported as OTLP/JSON, either appended to a local file (one export request
+# per line) or POSTed to a collector such as http://localhost:4318/v1/traces.
+TRACE_EXPORT_PATH = os.getenv("TRACE_EXPORT_PATH")
+TRACE_OTLP_ENDPOINT = os.getenv("TRACE_OTLP_ENDPOINT")
+SERVER_TIMING = os.getenv("SERVER_TIMING", "false").lower() == "true"
+TRACING_ENABLED = bool(TRACE_EXPORT_PATH or TRACE_OTLP_ENDPOINT or SERVER_TIMING)
+SERVICE_NAME = os.getenv("TRACE_SERVICE_NAME", "guardrails-backend")
+
+
+class Span:
+    def __init__(self, name, trace_id, parent_id=None, attributes=None):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.attributes = dict(attributes or {})
+        self.status = "ok"
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+
+    def set_attribute(self, key, value):
+        self.attributes[key] = value
+
+    @property
+    def duration_ms(self):
+        return ((self.end_ns or time.time_ns()) - self.start_ns) / 1e6
+
+    def to_otlp(self):
+        span = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": 1,
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns),
+            "attributes": [{"key": key, "value": _otlp_value(value)} for key, value in self.attributes.items()],
+            "status": {"code": 2 if self.status == "error" else 1},
+        }
+        if self.parent_id:
+            span["parentSpanId"] = self.parent_id
+        return span
+
+
+class _NoopSpan:
+    def set_attribute(self, key, value):
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+def _otlp_value(value):
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+class SpanExporter:
+    """Exports finished traces from a background thread so the request path never waits on I/O."""
+
+    def __init__(self, path=None, endpoint=None):
+        self.path = path
+        self.endpoint = endpoint
+        self._queue = queue.Queue(maxsize=10000)
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def export(self, spans):
+        try:
+            self._queue.put_nowait(spans)
+        except queue.Full:
+            pass  # Dropping traces is better than blocking requests.
+
+    def _run(self):
+        while True:
+            spans = self._queue.get()
+            payload = {"resourceSpans": [{
+                "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": SERVICE_NAME}}]},
+                "scopeSpans": [{"scope": {"name": "guardrails-backend"}, "spans": [span.to_otlp() for span in spans]}],
+            }]}
+            try:
+                if self.path:
+                    with open(self.path, "a") as f:
+                        f.write(json.dumps(payload) + "\n")
+                if self.endpoint:
+                    requests.post(self.endpoint, json=payload, timeout=5)
+            except Exception:
+                pass
+
+
+exporter = SpanExporter(TRACE_EXPORT_PATH, TRACE_OTLP_ENDPOINT) if TRACE_EXPORT_PATH or TRACE_OTLP_ENDPOINT else None
+_current_span: ContextVar = ContextVar("current_span", default=None)
+_current_trace: ContextVar = ContextVar("current_trace", default=None)
+
+
+@contextmanager
+def trace(name, **attributes):
+    """Opens the root span of a request; every span started inside joins its trace."""
+    if not TRACING_ENABLED:
+        yield NOOP_SPAN, []
+        return
+
+    spans = []
+    trace_token = _current_trace.set(spans)
+    try:
+        with span(name, **attributes) as root:
+            yield root, spans
+    finally:
+        _current_trace.reset(trace_token)
+        if exporter:
+            exporter.export(spans)
+
+
+@contextmanager
+def span(name, **attributes):
+    spans = _current_trace.get()
+    if spans is None:
+        yield NOOP_SPAN
+        return
+
+    parent = _current_span.get()
+    current = Span(name, parent.trace_id if parent else secrets.token_hex(16), parent.span_id if parent else None, attributes)
+    token = _current_span.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.status = "error"
+        current.set_attribute("error", repr(e))
+        raise
+    finally:
+        current.end_ns = time.time_ns()
+        _current_span.reset(token)
+        spans.append(current)
+
+
+def current_span():
+    """The innermost open span, e.g. for attributes only known deep inside a call."""
+    return _current_span.get() or NOOP_SPAN
+
+
+def server_timing(spans, root):
+    """Server-Timing header value for the stages of a trace, e.g. verify_session;dur=1.2."""
+    return ", ".join(
+        f"{span.name};dur={span.duration_ms:.1f}"
+        for span in spans if span is not root
+    )